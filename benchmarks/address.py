@@ -0,0 +1,78 @@
+"""Measures how many addresses per second are parsed and validated.
+
+python benchmarks/address.py [--addresses 1000000]
+
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secmail.address import domain_set, parse_address, parse_addresses
+
+DOMAINS = [
+    "1secmail.com",
+    "1secmail.org",
+    "1secmail.net",
+    "kzccv.com",
+    "qiott.com",
+    "wuuvo.com",
+    "icznn.com",
+    "ezztt.com",
+]
+
+
+def make_addresses(amount: int):
+    alphabet = string.ascii_lowercase + string.digits
+    return [
+        "".join(random.choices(alphabet, k=12)) + "@" + random.choice(DOMAINS)
+        for _ in range(amount)
+    ]
+
+
+def naive(addresses):
+    pairs = []
+    for address in addresses:
+        login, domain = address.split("@")
+        if domain not in DOMAINS:
+            raise ValueError(address)
+        pairs.append((login, domain))
+    return pairs
+
+
+def report(name: str, amount: int, elapsed: float) -> None:
+    print(f"{name:<32} {amount / elapsed:>14,.0f} addresses/sec")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--addresses", type=int, default=1000000)
+    args = parser.parse_args()
+
+    addresses = make_addresses(args.addresses)
+    domains = domain_set(DOMAINS)
+
+    start = time.perf_counter()
+    naive(addresses)
+    report(
+        "split + list lookup (unvalidated)", len(addresses), time.perf_counter() - start
+    )
+
+    start = time.perf_counter()
+    for address in addresses:
+        parse_address(address, domains)
+    report("parse_address", len(addresses), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    parse_addresses(addresses, domains)
+    report("parse_addresses", len(addresses), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
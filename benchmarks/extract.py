@@ -0,0 +1,76 @@
+"""Measures how many messages per second the extraction pipeline handles.
+
+python benchmarks/extract.py [--messages 5000] [--workers 4]
+
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secmail.extract import Extractor
+from secmail.models import Message
+
+
+NEWSLETTER = "<p>Weekly digest, item {i}. Nothing to see here.</p>" * 400
+
+
+def make_messages(amount: int, text: bool):
+    messages = []
+    for i in range(amount):
+        html = (
+            "<html><style>p {color: red}</style><body>"
+            + NEWSLETTER.format(i=i)
+            + f"<p>Your code is {100000 + i}.</p>"
+            + f'<a href="https://example.com/verify?token={i}">Confirm</a>'
+            + "</body></html>"
+        )
+        response = {"id": i, "from": "noreply@example.com", "subject": "Verify"}
+        response["htmlBody"] = html
+        response["body"] = html
+        if text:
+            response["textBody"] = (
+                f"Your code is {100000 + i}.\nhttps://example.com/verify?token={i}"
+            )
+        messages.append(Message(response))
+    return messages
+
+
+def report(name: str, amount: int, elapsed: float) -> None:
+    print(f"{name:<28} {amount / elapsed:>12,.0f} messages/sec")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    extractor = Extractor()
+
+    for name, text in (("text fast path", True), ("html parse", False)):
+        messages = make_messages(args.messages, text)
+        start = time.perf_counter()
+        extractor.extract_many(messages)
+        report(name, len(messages), time.perf_counter() - start)
+
+    messages = make_messages(args.messages, False)
+    with ProcessPoolExecutor(args.workers) as pool:
+        asyncio.run(extractor.run(messages[: args.workers], executor=pool))
+        start = time.perf_counter()
+        asyncio.run(extractor.run(messages, executor=pool))
+        report(
+            f"html parse, {args.workers} processes",
+            len(messages),
+            time.perf_counter() - start,
+        )
+
+
+if __name__ == "__main__":
+    main()
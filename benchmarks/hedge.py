@@ -0,0 +1,102 @@
+"""Measures the tail latency of getMessages with and without hedged requests.
+
+Two local HTTP servers stand in for the API and a mirror. They answer
+after `--delay` and `--mirror-delay` seconds, but 1 in `--slow-every`
+requests of either takes `--slow-delay` seconds, which simulates hosts
+with a long tail.
+
+python benchmarks/hedge.py [--requests 2000] [--slow-every 20]
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import secmail
+
+
+def serve(delay) -> str:
+    """Starts a server answering every request after `delay()` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, don't wait for an ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            time.sleep(delay())
+            body = json.dumps(
+                [{"id": 1, "from": "a@b.c", "subject": "s", "date": "d"}]
+            ).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # the losing half of a hedged request was cancelled
+                pass
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def measure(name: str, client: secmail.AsyncClient, args) -> None:
+    latencies = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        await client.poll_inbox(f"user{i}@1secmail.com")
+        latencies.append(time.perf_counter() - started)
+    await client.aclose()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{name:<24} p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.002)
+    parser.add_argument("--slow-every", type=int, default=20)
+    parser.add_argument("--slow-delay", type=float, default=0.1)
+    parser.add_argument("--mirror-delay", type=float, default=0.004)
+    args = parser.parse_args()
+
+    def delay(base: float):
+        def sample() -> float:
+            if random.randrange(args.slow_every) == 0:
+                return args.slow_delay
+            return base
+
+        return sample
+
+    hosts = [serve(delay(args.delay)), serve(delay(args.mirror_delay))]
+
+    await measure("primary only", secmail.AsyncClient(host=hosts[0]), args)
+    await measure("two hosts, failover", secmail.AsyncClient(host=hosts), args)
+    await measure(
+        "two hosts, hedged", secmail.AsyncClient(host=hosts, hedge=True), args
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
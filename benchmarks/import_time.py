@@ -0,0 +1,92 @@
+"""Measures the cold start cost of the package and fails above a budget.
+
+python benchmarks/import_time.py [--runs 20] [--budget-ms 100]
+
+Every scenario runs in a fresh interpreter, the startup time of the same
+interpreter running the empty harness is subtracted. The budget applies
+to the fastest of the runs, which noise can only slow down, the median
+is reported alongside. Most of all, `import secmail` and constructing a
+client must neither import httpx, asyncio, sqlite3 or multiprocessing
+nor open a socket, whatever the machine. The CLI is reported without a
+budget, every command needs asyncio and httpx anyway.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = """
+import socket, sys
+def refuse(*args, **kwargs):
+    raise SystemExit("network access during cold start")
+socket.socket.connect = refuse
+socket.getaddrinfo = refuse
+{code}
+for module in ("httpx", "asyncio", "sqlite3", "multiprocessing"):
+    if module in sys.modules:
+        raise SystemExit(module + " imported during cold start")
+"""
+
+SCENARIOS = {
+    "import secmail": "import secmail",
+    "secmail.Client()": "import secmail; secmail.Client()",
+    "secmail.AsyncClient()": "import secmail; secmail.AsyncClient()",
+}
+
+
+def measure(args, runs: int) -> tuple:
+    """Returns the fastest and the median time of `runs` runs in ms."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(args, env=env, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise SystemExit(f"{' '.join(args)} failed:\n{result.stderr}")
+    return min(timings) * 1000, statistics.median(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=100,
+        help="maximum cost of a scenario above a bare interpreter (default: 100)",
+    )
+    args = parser.parse_args()
+
+    fastest, median = measure(
+        [sys.executable, "-S", "-c", CHECK.format(code="pass")], args.runs
+    )
+    print(f"{'interpreter startup':<28} {fastest:>8.1f} ms   median {median:>8.1f} ms")
+
+    failed = False
+    for name, code in SCENARIOS.items():
+        command = [sys.executable, "-S", "-c", CHECK.format(code=code)]
+        cost, cost_median = measure(command, args.runs)
+        cost, cost_median = cost - fastest, cost_median - median
+        status = "ok" if cost <= args.budget_ms else "OVER BUDGET"
+        failed = failed or cost > args.budget_ms
+        print(f"{name:<28} {cost:>+8.1f} ms   median {cost_median:>+8.1f} ms  {status}")
+
+    command = [sys.executable, "-S", "-m", "secmail", "--help"]
+    cost, cost_median = measure(command, args.runs)
+    print(
+        f"{'python -m secmail --help':<28} {cost - fastest:>+8.1f} ms"
+        f"   median {cost_median - median:>+8.1f} ms"
+    )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
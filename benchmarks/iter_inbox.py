@@ -0,0 +1,93 @@
+"""Compares get_inbox and iter_inbox on a large mailbox.
+
+A mock host streams a getMessages listing of `--messages` rows in chunks
+of `--chunk-size` bytes, which end anywhere within a row as they would on
+the network. Reported are the time until the first message is available
+and the total time, both without tracemalloc, which slows the parsing
+down, and the peak memory allocated in a separate run.
+
+python benchmarks/iter_inbox.py [--messages 100000] [--chunk-size 16384]
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import secmail
+
+
+def make_transport(amount: int, chunk_size: int) -> httpx.MockTransport:
+    rows = (
+        {
+            "id": amount - i,
+            "from": "noreply@example.com",
+            "subject": f"Message {i}",
+            "date": "2023-01-01 00:00:00",
+        }
+        for i in range(amount)
+    )
+    data = json.dumps(list(rows)).encode()
+
+    def body():
+        for start in range(0, len(data), chunk_size):
+            yield data[start : start + chunk_size]
+
+    return httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+
+
+def measure(name: str, consume) -> None:
+    started = time.perf_counter()
+    first, count = consume()
+    total = time.perf_counter() - started
+
+    tracemalloc.start()
+    consume()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<12} first {(first - started) * 1000:>8.1f} ms"
+        f"   total {total * 1000:>8.1f} ms   peak {peak / 2**20:>7.1f} MiB"
+        f"   ({count} messages)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=16384)
+    args = parser.parse_args()
+
+    client = secmail.Client()
+    client.client = httpx.Client(
+        transport=make_transport(args.messages, args.chunk_size)
+    )
+
+    def get_inbox():
+        inbox = client.get_inbox("johndoe@1secmail.com")
+        first = time.perf_counter()
+        return first, len(inbox)
+
+    def iter_inbox():
+        first = None
+        count = 0
+        for _ in client.iter_inbox("johndoe@1secmail.com"):
+            if first is None:
+                first = time.perf_counter()
+            count += 1
+        return first, count
+
+    measure("get_inbox", get_inbox)
+    measure("iter_inbox", iter_inbox)
+
+
+if __name__ == "__main__":
+    main()
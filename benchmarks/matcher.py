@@ -0,0 +1,129 @@
+"""Compares Matcher against searching the patterns of every waiter one by one.
+
+`--waiters` waiters are spread over `--addresses` addresses. Each waiter
+wants mail from one of 20 senders and has a subject pattern of its own,
+half of them plain literals and half regexes with a literal part. Every
+address receives an inbox of `--rows` rows, one in four of them sent to
+one of its waiters and the others from unknown senders.
+
+python benchmarks/matcher.py [--waiters 3000] [--addresses 30] [--rows 50]
+
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secmail.matcher import Matcher, Where
+from secmail.models import Inbox
+
+
+def make_waiters(args):
+    waiters = []
+    for i in range(args.waiters):
+        address = f"user{i % args.addresses}@1secmail.com"
+        sender = rf"noreply@service{i % 20}\.com"
+        if i % 2:
+            subject = f"Verify your account {i}"
+        else:
+            subject = rf"Your code for order {i} is \d{{6}}"
+        waiters.append((address, Where(from_address=sender, subject=subject)))
+    return waiters
+
+
+def make_inboxes(args):
+    random.seed(0)
+    inboxes = {}
+    for a in range(args.addresses):
+        rows = []
+        for r in range(args.rows):
+            # every fourth row is for one of the waiters of the address
+            i = random.randrange(a, args.waiters, args.addresses)
+            sender = i % 20 if r % 4 == 0 else random.randrange(20, 40)
+            rows.append(
+                Inbox(
+                    {
+                        "id": r,
+                        "from": f"noreply@service{sender}.com",
+                        "subject": random.choice(
+                            (
+                                f"Verify your account {i}",
+                                f"Your code for order {i} is 123456",
+                            )
+                        ),
+                        "date": "2023-01-01 00:00:00",
+                    }
+                )
+            )
+        inboxes[f"user{a}@1secmail.com"] = rows
+    return inboxes
+
+
+def naive(waiters, inboxes):
+    matched = 0
+    for address, rows in inboxes.items():
+        for row in rows:
+            for waiter_address, where in waiters:
+                if waiter_address != address:
+                    continue
+                if where.from_address.search(row.from_address) and where.subject.search(
+                    row.subject
+                ):
+                    matched += 1
+    return matched
+
+
+def indexed(matcher, inboxes):
+    matched = 0
+    for address, rows in inboxes.items():
+        for row in rows:
+            matched += len(matcher.match(address, row))
+    return matched
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waiters", type=int, default=3000)
+    parser.add_argument("--addresses", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=50)
+    args = parser.parse_args()
+
+    waiters = make_waiters(args)
+    inboxes = make_inboxes(args)
+    rows = args.addresses * args.rows
+
+    started = time.perf_counter()
+    matcher = Matcher()
+    tokens = [matcher.add(address, where) for address, where in waiters]
+    added = time.perf_counter() - started
+
+    for name, run in (
+        ("per-waiter search", lambda: naive(waiters, inboxes)),
+        ("Matcher", lambda: indexed(matcher, inboxes)),
+    ):
+        started = time.perf_counter()
+        matched = run()
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:<20} {elapsed / rows * 1000:>8.3f} ms per row"
+            f"   ({matched} matches in {rows} rows)"
+        )
+
+    started = time.perf_counter()
+    for token in tokens:
+        matcher.remove(token)
+    removed = time.perf_counter() - started
+    print(
+        f"adding {len(tokens)} waiters took {added * 1000:.1f} ms,"
+        f" removing them {removed * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
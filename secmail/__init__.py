@@ -1,6 +1,77 @@
-from .client import *
+from importlib import import_module
+
 from .config import *
-from .models import *
+
 
 __version__ = config.VERSION
 __all__ = ["Client"]
+
+
+# public names are imported on first access (PEP 562), so `import secmail`
+# does not pay for httpx, asyncio or multiprocessing until they are used
+_LAZY_ATTRIBUTES = {
+    ".client": (
+        "SecMailError",
+        "BadRequestError",
+        "AuthenticationError",
+        "ForbiddenError",
+        "NotFoundError",
+        "RateLimitError",
+        "ServerError",
+        "DeliveryError",
+        "DeadlineExceededError",
+        "default_path",
+        "Client",
+        "AsyncClient",
+    ),
+    ".address": (
+        "USERNAME_PATTERN",
+        "ADDRESS_PATTERN",
+        "is_valid_username",
+        "domain_set",
+        "parse_address",
+        "parse_addresses",
+    ),
+    ".models": ("Inbox", "Message", "Attachment"),
+    ".matcher": ("Where", "Matcher"),
+    ".extract": (
+        "CODE_PATTERN",
+        "LINK_PATTERN",
+        "MAGIC_LINK_PATTERN",
+        "Extraction",
+        "Extractor",
+    ),
+    ".shard": ("HashRing", "ShardedWatcher"),
+    ".dispatch": (
+        "Event",
+        "Sink",
+        "QueueSink",
+        "CallbackSink",
+        "WebhookSink",
+        "FileSink",
+        "Dispatcher",
+    ),
+    ".checkpoint": ("CheckpointStore",),
+    ".hosts": ("HostPool",),
+    ".timeouts": ("deadline",),
+    ".store": ("AttachmentStore",),
+}
+_LAZY = {name: module for module, names in _LAZY_ATTRIBUTES.items() for name in names}
+
+
+def __getattr__(name):
+    if name == "current_path":
+        # not cached, it follows the working directory like default_path()
+        return import_module(".client", __name__).current_path
+
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_LAZY, "current_path"})
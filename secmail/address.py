@@ -0,0 +1,116 @@
+import re
+
+from typing import AbstractSet, Iterable, List, Optional, Tuple
+
+
+USERNAME_PATTERN = re.compile(
+    r"(?![A-Za-z0-9._-]*(?:\.\.|--|__))[A-Za-z][A-Za-z0-9._-]{0,62}[A-Za-z0-9]"
+)
+# the login of an address may be anything the API accepts, generated ones
+# start with a digit too, USERNAME_PATTERN only applies to custom_email()
+ADDRESS_PATTERN = re.compile(
+    r"([A-Za-z0-9._-]{1,64})@((?:[A-Za-z0-9-]{1,63}\.)+[A-Za-z0-9-]{2,63})"
+)
+
+
+def is_valid_username(username: str) -> bool:
+    """Returns whether `username` can be used for a custom email address.
+
+    It must start with a letter, end with a letter or digit, be at most 64
+    characters long and contain no repeated `.`, `-` or `_`.
+    """
+    if username is None:
+        return False
+    return USERNAME_PATTERN.fullmatch(username) is not None
+
+
+def domain_set(domains: Optional[Iterable[str]]) -> Optional[AbstractSet[str]]:
+    """Returns `domains` as a lowercase set, sets are returned unchanged."""
+    if domains is None or isinstance(domains, (set, frozenset)):
+        return domains
+    return frozenset(domain.lower() for domain in domains)
+
+
+def parse_address(address: str, domains: Iterable[str] = None) -> Tuple[str, str]:
+    """This function splits an email address into its login and domain.
+
+    Parameters:
+    ----------
+    - `address`: `str` - The email address to parse. Surrounding whitespace is ignored and the domain is lowercased.
+    - `domains`: `Iterable[str]` (optional) - If provided, the domain must be one of them. Pass a `set` to avoid rebuilding it on every call.
+
+    Returns:
+    -------
+    - `(login, domain)`: `Tuple[str, str]` - The parsed address.
+
+    Example:
+    -------
+    >>> parse_address("johndoe@1secmail.com")
+    ('johndoe', '1secmail.com')
+
+    A ValueError is raised if the address is malformed or its domain is not one of `domains`.
+
+    """
+    pair = _parse(ADDRESS_PATTERN.fullmatch, address, domain_set(domains))
+    if pair is None:
+        raise ValueError(_error(address, domains))
+    return pair
+
+
+def parse_addresses(
+    addresses: Iterable[str], domains: Iterable[str] = None, skip_invalid=False
+) -> List[Tuple[str, str]]:
+    """This function parses and validates many email addresses at once.
+
+    Parameters:
+    ----------
+    - `addresses`: `Iterable[str]` - The email addresses to parse.
+    - `domains`: `Iterable[str]` (optional) - If provided, every domain must be one of them.
+    - `skip_invalid`: `bool` (optional) - Drop invalid addresses instead of raising a ValueError.
+
+    Returns:
+    -------
+    - `pairs`: `List[Tuple[str, str]]` - The `(login, domain)` pair of every valid address, in order.
+
+    Example:
+    -------
+    >>> parse_addresses(open("addresses.txt"), domains=client.domain_set, skip_invalid=True)
+
+    The address pattern and the domain set are prepared once for the whole batch, which makes this much faster than parsing the addresses one by one.
+
+    """
+    match = ADDRESS_PATTERN.fullmatch
+    domains = domain_set(domains)
+    # there are few distinct domains, lowercase each of them only once
+    lowered = {}
+
+    pairs = []
+    append = pairs.append
+    for address in addresses:
+        m = match(address) or match(address.strip())
+        if m is not None:
+            login, domain = m.groups()
+            domain = lowered.get(domain) or lowered.setdefault(domain, domain.lower())
+            if domains is None or domain in domains:
+                append((login, domain))
+                continue
+        if not skip_invalid:
+            raise ValueError(_error(address, domains))
+    return pairs
+
+
+def _parse(match, address, domains) -> Optional[Tuple[str, str]]:
+    m = match(address) or match(address.strip())
+    if m is None:
+        return None
+    login, domain = m.groups()
+    domain = domain.lower()
+    if domains is not None and domain not in domains:
+        return None
+    return login, domain
+
+
+def _error(address, domains) -> str:
+    if domains is not None and ADDRESS_PATTERN.fullmatch(address.strip()):
+        return f"{address.strip()} does not use a valid domain name.\nValid Domains: {sorted(domains)}"
+    return f"'{address}' is not a valid email address."
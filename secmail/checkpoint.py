@@ -0,0 +1,154 @@
+import time
+import sqlite3
+import threading
+
+from typing import Dict, Iterable, Optional, Set
+
+
+class CheckpointStore:
+    """A crash-safe store for the message ids a watcher has already seen.
+
+    >>> store = secmail.CheckpointStore("watcher.db")
+    >>> message = client.await_new_message("johndoe@1secmail.com", checkpoint=store)
+
+    The state lives in an sqlite database in WAL mode. Writes are buffered
+    in memory and committed in one transaction once `flush_size` ids are
+    pending or `flush_interval` seconds passed, so polling never waits for
+    a disk sync. A crash loses at most the last unflushed batch, whose
+    messages are then reported again: delivery is at-least-once, nothing
+    that arrived while the watcher was down is missed.
+
+    Ids of messages which left the mailbox are dropped by `retain()`, and
+    `compact()` checkpoints the WAL back into the database file.
+
+    """
+
+    def __init__(
+        self, path: str, flush_interval: float = 1.0, flush_size: int = 1000
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # with WAL, NORMAL only syncs on checkpoints and survives process crashes
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS addresses (address TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS seen (
+                address TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (address, id)
+            ) WITHOUT ROWID;
+            """)
+        self.db.commit()
+
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Set[int]] = {}
+        self.pending_count = 0
+        self.retained: Dict[str, Set[int]] = {}
+        self.flushed = time.monotonic()
+
+    def __enter__(self) -> "CheckpointStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def load(self, address: str) -> Optional[Set[int]]:
+        """Returns the seen ids of `address`, or `None` if it was never checkpointed."""
+        return self.load_many([address]).get(address)
+
+    def load_many(self, addresses: Iterable[str]) -> Dict[str, Set[int]]:
+        """Returns the seen ids of every checkpointed address among `addresses`."""
+        self.flush()
+        addresses = list(addresses)
+        state: Dict[str, Set[int]] = {}
+        with self.lock:
+            for start in range(0, len(addresses), 500):
+                chunk = addresses[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                for (address,) in self.db.execute(
+                    f"SELECT address FROM addresses WHERE address IN ({marks})", chunk
+                ):
+                    state[address] = set()
+                for address, id in self.db.execute(
+                    f"SELECT address, id FROM seen WHERE address IN ({marks})", chunk
+                ):
+                    state[address].add(id)
+        return state
+
+    def add(self, address: str, ids: Iterable[int] = ()) -> None:
+        """Marks `ids` of `address` as seen, an empty `ids` records the address itself."""
+        with self.lock:
+            pending = self.pending.get(address)
+            if pending is None:
+                pending = self.pending[address] = set()
+                self.pending_count += 1
+            before = len(pending)
+            pending.update(ids)
+            self.pending_count += len(pending) - before
+            if address in self.retained:
+                self.retained[address].update(pending)
+        self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        """Flushes if `flush_size` writes are pending or `flush_interval` seconds passed."""
+        if self.pending_count >= self.flush_size or (
+            (self.pending or self.retained)
+            and time.monotonic() - self.flushed >= self.flush_interval
+        ):
+            self.flush()
+
+    def retain(self, address: str, ids: Iterable[int]) -> None:
+        """Forgets the seen ids of `address` which are not in `ids`, e.g. the current inbox."""
+        with self.lock:
+            self.retained[address] = set(ids)
+
+    def flush(self) -> None:
+        """Commits the pending writes in one transaction."""
+        with self.lock:
+            pending, self.pending, self.pending_count = self.pending, {}, 0
+            retained, self.retained = self.retained, {}
+            self.flushed = time.monotonic()
+            if not pending and not retained:
+                return
+
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO addresses (address) VALUES (?)",
+                    ((address,) for address in pending),
+                )
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO seen (address, id) VALUES (?, ?)",
+                    ((address, id) for address, ids in pending.items() for id in ids),
+                )
+                for address, ids in retained.items():
+                    current = {
+                        id
+                        for (id,) in self.db.execute(
+                            "SELECT id FROM seen WHERE address = ?", (address,)
+                        )
+                    }
+                    self.db.executemany(
+                        "DELETE FROM seen WHERE address = ? AND id = ?",
+                        ((address, id) for id in current - ids),
+                    )
+
+    def forget(self, address: str) -> None:
+        """Removes all state of `address`."""
+        self.flush()
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM seen WHERE address = ?", (address,))
+            self.db.execute("DELETE FROM addresses WHERE address = ?", (address,))
+
+    def compact(self) -> None:
+        """Flushes and moves the WAL back into the database file."""
+        self.flush()
+        with self.lock:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        self.compact()
+        self.db.close()
@@ -0,0 +1,466 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from typing import Iterator, List
+
+from .address import parse_address
+from .config import VERSION
+from .client import AsyncClient, SecMailError, _check_inbox
+
+
+# utils
+
+
+class RateLimiter:
+    """A token bucket shared by all tasks of a command.
+
+    >>> limiter = RateLimiter(rate=20)
+    >>> await limiter.acquire()
+
+    """
+
+    def __init__(self, rate: float = None, burst: int = None) -> None:
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class JSONLWriter:
+    """Buffers JSON lines and writes them out in batches.
+
+    Lines are flushed once `buffer` lines are pending or `flush_interval`
+    seconds passed since the last flush, whichever comes first.
+    """
+
+    def __init__(self, stream, buffer: int = 256, flush_interval: float = 1.0):
+        self.stream = stream
+        self.buffer = buffer
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.flushed = time.monotonic()
+
+    def write(self, record: dict) -> None:
+        self.pending.append(json.dumps(record, ensure_ascii=False))
+        if (
+            len(self.pending) >= self.buffer
+            or time.monotonic() - self.flushed >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            self.stream.write("\n".join(self.pending) + "\n")
+            self.pending.clear()
+        self.stream.flush()
+        self.flushed = time.monotonic()
+
+
+def read_addresses(path: str, err: "JSONLWriter") -> List[str]:
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        addresses = {}
+        for line in _parse_lines(f):
+            try:
+                login, domain = parse_address(line)
+            except ValueError as e:
+                err.write(_error(line, e))
+                continue
+            addresses[f"{login}@{domain}"] = None
+        return list(addresses)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _parse_lines(f) -> Iterator[str]:
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def _error(address: str, e: Exception) -> dict:
+    return {"address": address, "error": type(e).__name__, "detail": str(e)}
+
+
+class Runner:
+    """Runs client calls with bounded concurrency and a shared rate limit."""
+
+    def __init__(self, args, client: AsyncClient) -> None:
+        import httpx
+
+        self.client = client
+        self.retry_on = (SecMailError, httpx.TransportError)
+        self.concurrency = args.concurrency
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.limiter = RateLimiter(args.rate)
+        self.out = JSONLWriter(sys.stdout, args.buffer, args.flush_interval)
+        self.err = JSONLWriter(sys.stderr, 1)
+        self.retries = args.retries
+
+    async def call(self, method, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self.semaphore:
+                    return await method(*args, **kwargs)
+            except self.retry_on:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(min(2**attempt, 30))
+
+    async def map(self, func, items) -> None:
+        # keep a bounded window of tasks instead of one task per item
+        pending = set()
+        for item in items:
+            if len(pending) >= self.concurrency * 2:
+                _, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+            pending.add(asyncio.ensure_future(func(item)))
+        if pending:
+            await asyncio.wait(pending)
+
+
+# commands
+
+
+async def gen(args, runner: Runner) -> None:
+    # random_email() is synchronous, fetch the domains without blocking the loop
+    await runner.call(runner.client.load_domains)
+    chunk = max(1, args.buffer)
+    for start in range(0, args.amount, chunk):
+        amount = min(chunk, args.amount - start)
+        for address in runner.client.random_email(amount, args.domain):
+            runner.out.write({"address": address})
+
+
+async def fetch(args, runner: Runner) -> None:
+    async def fetch_address(address: str) -> None:
+        try:
+            inbox = await runner.call(runner.client.get_inbox, address)
+        except Exception as e:
+            runner.err.write(_error(address, e))
+            return
+
+        for message in inbox:
+            if args.full:
+                try:
+                    message = await runner.call(
+                        runner.client.get_message, address, message.id
+                    )
+                except Exception as e:
+                    runner.err.write(_error(address, e))
+                    continue
+            runner.out.write({"address": address, **message.to_dict()})
+
+    await runner.map(fetch_address, read_addresses(args.addresses, runner.err))
+
+
+async def watch(args, runner: Runner) -> None:
+    addresses = read_addresses(args.addresses, runner.err)
+    # None until the first poll of an address seeded its seen ids
+    seen = dict.fromkeys(addresses)
+    fingerprints = {}
+    checkpoint = None
+    if args.checkpoint:
+        from .checkpoint import CheckpointStore
+
+        checkpoint = CheckpointStore(args.checkpoint)
+        seen.update(checkpoint.load_many(addresses))
+    # ids emitted this cycle, checkpointed once the output is flushed
+    emitted = []
+
+    async def poll(address: str) -> None:
+        try:
+            await poll_address(address)
+        except Exception as e:
+            # a bad response only costs this address a cycle, polling goes on
+            runner.err.write(_error(address, e))
+
+    async def poll_address(address: str) -> None:
+        inbox, fingerprint = await runner.call(
+            runner.client.poll_inbox, address, fingerprints.get(address)
+        )
+        if _check_inbox(inbox) is None:
+            return
+
+        ids = seen[address]
+        if ids is None:
+            ids = seen[address] = set()
+            if not args.include_existing:
+                ids.update(message.id for message in inbox)
+                fingerprints[address] = fingerprint
+                emitted.append((address, list(ids)))
+                return
+
+        complete = True
+        for message in inbox:
+            if message.id in ids:
+                continue
+            if args.full:
+                try:
+                    message = await runner.call(
+                        runner.client.get_message, address, message.id
+                    )
+                except Exception as e:
+                    # not marked as seen, the next cycle tries again
+                    runner.err.write(_error(address, e))
+                    complete = False
+                    continue
+            runner.out.write({"address": address, **message.to_dict()})
+            ids.add(message.id)
+            emitted.append((address, [message.id]))
+
+        # an identical payload is only skipped once all of its rows went out
+        if complete:
+            fingerprints[address] = fingerprint
+
+    try:
+        while True:
+            started = time.monotonic()
+            await runner.map(poll, addresses)
+            runner.out.flush()
+            if checkpoint is not None:
+                try:
+                    for address, ids in emitted:
+                        checkpoint.add(address, ids)
+                    checkpoint.flush_if_due()
+                except Exception as e:
+                    # like after a crash, the messages are reported again
+                    # after a restart
+                    runner.err.write(_error(args.checkpoint, e))
+            emitted.clear()
+            await asyncio.sleep(max(0, args.interval - (time.monotonic() - started)))
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+
+async def attachments(args, runner: Runner) -> None:
+    store = None
+    if args.store:
+        from .store import AttachmentStore
+
+        store = AttachmentStore(args.store)
+
+    async def download(address: str) -> None:
+        try:
+            inbox = await runner.call(runner.client.get_inbox, address)
+        except Exception as e:
+            runner.err.write(_error(address, e))
+            return
+
+        for row in inbox:
+            try:
+                message = await runner.call(runner.client.get_message, address, row.id)
+            except Exception as e:
+                runner.err.write(_error(address, e))
+                continue
+
+            save_path = os.path.join(args.output, address, str(message.id), "")
+            for attachment in message.attachments or ():
+                os.makedirs(save_path, exist_ok=True)
+                try:
+                    await runner.call(
+                        runner.client.download_attachment,
+                        address,
+                        message.id,
+                        attachment.filename,
+                        save_path,
+                        store=store,
+                    )
+                except Exception as e:
+                    runner.err.write(_error(address, e))
+                    continue
+                runner.out.write(
+                    {
+                        "address": address,
+                        "id": message.id,
+                        "filename": attachment.filename,
+                        "path": save_path + attachment.filename,
+                        "size": attachment.size,
+                    }
+                )
+
+    try:
+        await runner.map(download, read_addresses(args.addresses, runner.err))
+    finally:
+        if store is not None:
+            store.close()
+
+
+COMMANDS = {"gen": gen, "fetch": fetch, "watch": watch, "attachments": attachments}
+
+
+# parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--concurrency",
+        type=int,
+        default=32,
+        help="maximum number of requests in flight (default: 32)",
+    )
+    common.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="maximum requests per second, unlimited if omitted",
+    )
+    common.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="retries for a failed request, with exponential backoff (default: 2)",
+    )
+    common.add_argument(
+        "--buffer",
+        type=int,
+        default=256,
+        help="number of output lines buffered before writing (default: 256)",
+    )
+    common.add_argument(
+        "--flush-interval",
+        type=float,
+        default=1.0,
+        help="maximum seconds output stays buffered (default: 1.0)",
+    )
+    common.add_argument(
+        "--host",
+        action="append",
+        default=None,
+        help="API host or URL like http://127.0.0.1:8001, repeat to fail over between mirrors (default: www.1secmail.com)",
+    )
+    common.add_argument(
+        "--timeout",
+        type=float,
+        default=5.0,
+        help="seconds a single request may take (default: 5)",
+    )
+    common.add_argument(
+        "--hedge",
+        action="store_true",
+        help="duplicate slow reads to a second host, needs several --host",
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="python -m secmail",
+        description="Bulk operations on www.1secmail.com, output is written as JSON lines.",
+    )
+    parser.add_argument("--version", action="version", version=VERSION)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("gen", parents=[common], help="generate random addresses")
+    p.add_argument("amount", type=int, help="number of addresses to generate")
+    p.add_argument("--domain", default=None, help="domain to use for every address")
+
+    p = commands.add_parser(
+        "fetch", parents=[common], help="download the inboxes of many addresses"
+    )
+    p.add_argument("addresses", help="file with one address per line, - for stdin")
+    p.add_argument(
+        "--full", action="store_true", help="fetch every message, not only the inbox"
+    )
+
+    p = commands.add_parser(
+        "watch", parents=[common], help="stream new messages as they arrive"
+    )
+    p.add_argument("addresses", help="file with one address per line, - for stdin")
+    p.add_argument(
+        "--interval",
+        type=float,
+        default=5,
+        help="seconds between two polls of an address (default: 5)",
+    )
+    p.add_argument(
+        "--full", action="store_true", help="fetch every new message, not only the row"
+    )
+    p.add_argument(
+        "--include-existing",
+        action="store_true",
+        help="also emit messages already in the inbox on startup",
+    )
+    p.add_argument(
+        "--checkpoint",
+        default=None,
+        metavar="PATH",
+        help="sqlite file the seen messages are kept in, to resume after a restart",
+    )
+
+    p = commands.add_parser(
+        "attachments", parents=[common], help="download every attachment"
+    )
+    p.add_argument("addresses", help="file with one address per line, - for stdin")
+    p.add_argument(
+        "--output",
+        default=os.path.join(".", "attachments"),
+        help="directory attachments are saved to, one folder per address and message",
+    )
+    p.add_argument(
+        "--store",
+        default=None,
+        metavar="PATH",
+        help="content-addressed store, known attachments are linked, not downloaded",
+    )
+
+    return parser
+
+
+async def run(args) -> None:
+    import httpx
+
+    client = AsyncClient(
+        host=args.host or "www.1secmail.com", hedge=args.hedge, timeout=args.timeout
+    )
+    # size the connection pool to the requested concurrency so every
+    # in-flight request can reuse a keep-alive connection
+    client.client = httpx.AsyncClient(
+        timeout=args.timeout,
+        limits=httpx.Limits(
+            max_connections=args.concurrency,
+            max_keepalive_connections=args.concurrency,
+        ),
+    )
+    runner = Runner(args, client)
+    try:
+        await COMMANDS[args.command](args, runner)
+    finally:
+        runner.out.flush()
+        await client.aclose()
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # the reader went away, e.g. `python -m secmail watch ... | head`
+        sys.stderr.close()
+        return 141
+    return 0
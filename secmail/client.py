@@ -1,22 +1,40 @@
 import os
 import re
-import asyncio
 import random
 import string
-import httpx
 import time
 import json
-
-from typing import List
+import codecs
+
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Container,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 from json import JSONDecodeError
 
+from .address import domain_set, is_valid_username, parse_address
 from .config import (
     GET_DOMAIN_LIST,
     GET_MESSAGES,
     GET_SINGLE_MESSAGE,
     DOWNLOAD,
 )
+from .hosts import HostPool
+from .matcher import Matcher, Where
 from .models import Inbox, Message
+from .timeouts import clear_deadline, deadline, remaining
+
+
+if TYPE_CHECKING:
+    from .checkpoint import CheckpointStore
+    from .store import AttachmentStore
 
 
 # errors
@@ -82,19 +100,289 @@ class ServerError(SecMailError):
     pass
 
 
+class DeliveryError(SecMailError):
+    """DeliveryError()
+
+    Exception recorded by a `Dispatcher` for events it stopped without delivering, they are listed in `events`
+    """
+
+    def __init__(self, message: str, events: list) -> None:
+        super().__init__(message)
+        self.events = events
+
+
+class DeadlineExceededError(SecMailError, TimeoutError):
+    """DeadlineExceededError()
+
+    Exception raised when a `timeout` or `deadline()` expires before the operation completed
+    """
+
+    pass
+
+
 # utils
 
 
-def is_valid_username(username: str) -> bool:
-    if username is None or len(username) > 64:
-        return False
-    return bool(
-        re.match(r"^[A-Za-z][A-Za-z0-9._-]*[A-Za-z0-9]$", username)
-        and not re.search(r"\.\.|\-\-|\_\_|\.$", username)
+def _current_path() -> str:
+    return os.path.abspath(os.getcwd())
+
+
+def default_path() -> str:
+    return _current_path() + "/config/"
+
+
+def __getattr__(name):
+    # `current_path` used to be a constant computed at import time
+    if name == "current_path":
+        return _current_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _raise_for_status(r) -> None:
+    if r.status_code == 400:
+        raise BadRequestError(f"HTTP {r.status_code}: {r.text}")
+    if r.status_code == 401:
+        raise AuthenticationError(f"HTTP {r.status_code}: {r.text}")
+    if r.status_code == 403:
+        raise ForbiddenError(f"HTTP {r.status_code}: {r.text}")
+    if r.status_code == 404:
+        raise NotFoundError(f"HTTP {r.status_code}: {r.text}")
+    if r.status_code == 429:
+        raise RateLimitError(f"HTTP {r.status_code}: {r.text}")
+    if r.status_code >= 500:
+        raise ServerError(f"HTTP {r.status_code}: {r.text}")
+
+
+def _decode(r, data_type=None):
+    try:
+        r = r.json()
+    except JSONDecodeError:
+        return r.text
+
+    if data_type is not None:
+        if isinstance(r, list):
+            r = [data_type(result) for result in r]
+        elif r is not None:
+            r = data_type(r)
+
+    return r
+
+
+# idempotent reads which may be duplicated to a second host
+_HEDGED = frozenset((GET_MESSAGES, GET_SINGLE_MESSAGE))
+
+
+def _failover_errors() -> tuple:
+    import httpx
+
+    return (httpx.TransportError, ServerError, RateLimitError)
+
+
+def _expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def _deadline_exceeded() -> DeadlineExceededError:
+    return DeadlineExceededError("The deadline passed before the operation completed.")
+
+
+def _time_left() -> Optional[float]:
+    # seconds left until the current deadline, raises once it passed
+    if _expired():
+        raise _deadline_exceeded()
+    return remaining()
+
+
+def _read_body(r):
+    # httpx applies its timeout to every read, a body trickling in would
+    # outlive the deadline without the check between chunks
+    import httpx
+
+    if r.is_stream_consumed:
+        # read already, e.g. by a mock transport
+        return r
+    chunks = []
+    try:
+        for chunk in r.iter_raw():
+            _time_left()
+            chunks.append(chunk)
+    finally:
+        r.close()
+    return httpx.Response(
+        r.status_code, headers=r.headers, content=b"".join(chunks), request=r.request
     )
 
 
-current_path = os.path.abspath(os.getcwd())
+def _check_inbox(inbox):
+    # get_inbox() hands back the text of a response which is not JSON,
+    # a poll loop must not iterate over it
+    if inbox is not None and not isinstance(inbox, list):
+        raise SecMailError(f"Unexpected getMessages response: {inbox!r:.100}")
+    return inbox
+
+
+def _sleep_time(interval: float) -> float:
+    left = _time_left()
+    return interval if left is None else min(interval, left)
+
+
+def _host_pool(host) -> HostPool:
+    return host if isinstance(host, HostPool) else HostPool(host)
+
+
+def _mark_seen(checkpoint: "CheckpointStore", address: str, id: int) -> None:
+    if checkpoint is not None:
+        checkpoint.add(address, [id])
+        checkpoint.flush()
+
+
+def _fingerprint(content: bytes) -> tuple:
+    return len(content), hash(content)
+
+
+class _InboxCache:
+    """Remembers the fingerprint and decoded inbox of the last `getMessages`
+    response per polled address, so an identical payload is neither JSON
+    decoded nor turned into `Inbox` objects again.
+
+    A single poller already skips an unchanged payload by its own
+    fingerprint and never hits the cache. Hits come from several callers
+    polling the same address with fingerprints of their own, e.g. a
+    dispatcher and `await_new_message()`, and an entry only has to live
+    from the poll of one caller to the next one's. Entries are only added
+    when a payload changed, so a few hundred cover the addresses changing
+    within a polling interval while the inboxes kept alive stay bounded.
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.entries = {}
+
+    def get(self, key: tuple, fingerprint: tuple) -> Optional[List[Inbox]]:
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        return None
+
+    def put(self, key: tuple, fingerprint: tuple, inbox: List[Inbox]) -> None:
+        if key not in self.entries and len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+        self.entries[key] = (fingerprint, inbox)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# what may still follow a number decoded at the end of the buffer
+_NUMBER_TAIL = re.compile(r"(?:\.\d*)?(?:[eE][-+]?\d*)?")
+
+
+class _ArrayParser:
+    """Decodes the items of a JSON array while its bytes arrive.
+
+    Only the unparsed tail of the response is buffered, an item is returned
+    by `feed()` as soon as its last byte was received.
+
+    Objects, the rows of an inbox, are decoded a run at a time: everything
+    up to the last ``}`` of the buffer is tried as one array, which is only
+    valid JSON if that ``}`` ends a top-level item. An incomplete object is
+    not decoded again before a chunk brings a ``}`` that may end it.
+    """
+
+    def __init__(self) -> None:
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.started = False
+        self.done = False
+        # "first" item or "]", an "item" after a comma, or a "separator"
+        self.expect = "first"
+        # length of the buffer when its first item was found incomplete
+        self.checked = 0
+
+    def feed(self, chunk: bytes) -> list:
+        self.buffer += self.text.decode(chunk)
+        return self._items(final=False)
+
+    def close(self) -> list:
+        self.buffer += self.text.decode(b"", final=True)
+        items = self._items(final=True)
+        if not self.done:
+            raise JSONDecodeError("Unterminated array", self.buffer, len(self.buffer))
+        return items
+
+    def _items(self, final: bool) -> list:
+        items = []
+        buffer = self.buffer
+        size = len(buffer)
+        pos = _WHITESPACE.match(buffer).end()
+
+        if not self.started and pos < size:
+            if buffer[pos] != "[":
+                raise JSONDecodeError("Expecting an array", buffer, pos)
+            self.started = True
+            pos = _WHITESPACE.match(buffer, pos + 1).end()
+
+        decode = self.decoder.raw_decode
+        start = pos
+        checked, self.checked = self.checked, 0
+        while self.started and not self.done and pos < size:
+            char = buffer[pos]
+            if self.expect == "separator":
+                if char == ",":
+                    self.expect = "item"
+                elif char == "]":
+                    self.done = True
+                else:
+                    raise JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                pos = _WHITESPACE.match(buffer, pos + 1).end()
+                continue
+            if char == "]" and self.expect == "first":
+                self.done = True
+                pos = _WHITESPACE.match(buffer, pos + 1).end()
+                continue
+            if char in ",]":
+                raise JSONDecodeError("Expecting value", buffer, pos)
+
+            if char == "{":
+                last = buffer.rfind("}", pos)
+                if not final and last < (checked if pos == start else 0):
+                    # nothing arrived that could end the object
+                    self.checked = size - pos
+                    break
+                try:
+                    run = json.loads("[" + buffer[pos : last + 1] + "]")
+                except JSONDecodeError:
+                    # the last "}" is within an incomplete item, one at a time
+                    run = None
+                if run:
+                    items.extend(run)
+                    self.expect = "separator"
+                    pos = _WHITESPACE.match(buffer, last + 1).end()
+                    continue
+
+            try:
+                item, end = decode(buffer, pos)
+            except JSONDecodeError:
+                if final:
+                    raise
+                # the item is still incomplete
+                self.checked = size - pos
+                break
+            if (
+                not final
+                and type(item) in (int, float)
+                and _NUMBER_TAIL.fullmatch(buffer, end)
+            ):
+                # digits, a fraction or an exponent may follow in the next chunk
+                break
+            items.append(item)
+            self.expect = "separator"
+            pos = _WHITESPACE.match(buffer, end).end()
+
+        if self.done and pos < size:
+            raise JSONDecodeError("Extra data", buffer, pos)
+        self.buffer = buffer[pos:]
+        return items
 
 
 # client
@@ -106,47 +394,235 @@ class Client:
     >>> import secmail
     >>> client = secmail.Client()
 
+    `host` may be a list of mirrors or a `HostPool`: requests go to the
+    fastest healthy host and fail over to the next one on connection
+    errors, 5xx and 429 responses. With `hedge`, a `getMessages` or
+    `readMessage` call still unanswered after the pool's p95 latency is
+    duplicated to a second host and the first response wins.
+
+    `timeout` limits every single request, as in httpx. Calls also take a
+    `timeout` for the whole operation, and `secmail.deadline()` sets one
+    for a block of calls.
+
     """
 
     def __init__(
-        self, base_path=current_path + "/config/", host="www.1secmail.com"
+        self,
+        base_path=None,
+        host: Union[str, List[str], HostPool] = "www.1secmail.com",
+        hedge: bool = False,
+        timeout: Optional[float] = 5.0,
     ) -> None:
-        self.base_path = base_path
-        self.api_url = "https://" + host + "/api/v1/"
-        self.client = httpx.Client()
-        self.domain_list = self.get_active_domains()
+        self.base_path = base_path or default_path()
+        self.hosts = _host_pool(host)
+        self.hedge = hedge
+        self.timeout = timeout
+        self._executor = None
+        self._client = None
+        self._closed = False
+        self._domain_list = None
+        self._domain_set = None
+        self._inbox_cache = _InboxCache()
+
+    @property
+    def client(self):
+        # httpx is only imported once the first request is made
+        if self._client is None:
+            if self._closed:
+                raise RuntimeError("The client was closed.")
+            import httpx
+
+            self._client = httpx.Client(timeout=self.timeout)
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    @property
+    def domain_list(self) -> List[str]:
+        if self._domain_list is None:
+            self._domain_list = self.get_active_domains()
+        return self._domain_list
+
+    @domain_list.setter
+    def domain_list(self, domain_list: List[str]) -> None:
+        self._domain_list = domain_list
+        self._domain_set = None
+
+    @property
+    def domain_set(self) -> FrozenSet[str]:
+        if self._domain_set is None:
+            self._domain_set = domain_set(self.domain_list)
+        return self._domain_set
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the HTTP connections and stops the threads of hedged requests.
+
+        The client can also be used as a context manager, which closes it on exit.
+        """
+        if self._executor is not None:
+            # not waited for, a losing request still running ends with its
+            # response or its timeout
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        self._closed = True
+
+    def _parse_address(self, address: str) -> tuple:
+        # checked against the domains once they were loaded, a request
+        # must not cost an extra getDomainList request to validate it
+        domains = None if self._domain_list is None else self.domain_set
+        return parse_address(address, domains)
+
+    def _send(self, action: str, params=None, stream: bool = False):
+        hosts = self.hosts.ranked()
+        if self.hedge and action in _HEDGED and len(hosts) > 1:
+            return self._send_hedged(hosts, action, params, stream)
+
+        failover = _failover_errors()
+        for host in hosts[:-1]:
+            try:
+                return self._send_to(host, action, params, stream)
+            except failover:
+                pass
+        return self._send_to(hosts[-1], action, params, stream)
+
+    def _send_to(self, host: str, action: str, params=None, stream: bool = False):
+        left = _time_left()
+        kwargs = {}
+        if left is not None:
+            kwargs["timeout"] = (
+                left if self.timeout is None else min(left, self.timeout)
+            )
 
-    def _request(self, action: str, params=None, data_type=None):
-        r = self.client.request(method="GET", url=self.api_url + action, params=params)
-
-        if r.status_code == 400:
-            raise BadRequestError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 401:
-            raise AuthenticationError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 403:
-            raise ForbiddenError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 404:
-            raise NotFoundError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 429:
-            raise RateLimitError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 500:
-            raise ServerError(f"HTTP {r.status_code}: {r.text}")
+        started = time.monotonic()
+        try:
+            request = self.client.build_request(
+                "GET", self.hosts.url(host) + action, params=params, **kwargs
+            )
+            r = self.client.send(request, stream=stream or left is not None)
+            if stream:
+                if r.status_code >= 400:
+                    r.read()
+            elif left is not None:
+                r = _read_body(r)
+            _raise_for_status(r)
+        except DeadlineExceededError:
+            self.hosts.record(host, time.monotonic() - started, sample=False)
+            raise
+        except _failover_errors() as e:
+            if _expired():
+                self.hosts.record(host, time.monotonic() - started, sample=False)
+                raise _deadline_exceeded() from e
+            self.hosts.record_failure(host)
+            raise
+        self.hosts.record(host, time.monotonic() - started)
+        return r
 
-        if action == DOWNLOAD:
-            return r.content
+    def _send_hedged(
+        self, hosts: List[str], action: str, params=None, stream: bool = False
+    ):
+        import contextvars
+
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="secmail-hedge")
+        failover = _failover_errors()
+        delay = self.hosts.hedge_delay()
+        untried = list(hosts)
+
+        futures = []
 
+        def start(host: str):
+            # the threads run with the caller's deadline
+            context = contextvars.copy_context()
+            future = self._executor.submit(
+                context.run, self._send_to, host, action, params, stream
+            )
+            futures.append(future)
+            return future
+
+        def discard(future) -> None:
+            # a losing stream must hand its connection back to the pool
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        pending = {start(untried.pop(0))}
+        hedged = False
+        error = None
+        winner = None
         try:
-            r = r.json()
-        except JSONDecodeError:
-            return r.text
+            while pending:
+                timeout = None if hedged or not untried else delay
+                done, pending = wait(pending, timeout, FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    pending.add(start(untried.pop(0)))
+                    continue
+                for future in done:
+                    error = future.exception()
+                    if error is None:
+                        winner = future
+                        return future.result()
+                    if not isinstance(error, failover):
+                        raise error
+                if not pending and untried:
+                    pending.add(start(untried.pop(0)))
+        finally:
+            # a running thread cannot be interrupted, its response is dropped
+            for future in futures:
+                if future is not winner:
+                    future.cancel()
+                    if stream:
+                        future.add_done_callback(discard)
+        raise error
+
+    def check_hosts(self) -> Dict[str, Optional[float]]:
+        """This method probes every host and updates its score in the pool.
 
-        if data_type is not None:
-            if isinstance(r, list):
-                r = [data_type(result) for result in r]
-            elif r is not None:
-                r = data_type(r)
+        Returns:
+        -------
+        - `latencies`: `Dict[str, Optional[float]]` - The response time of every host in seconds, `None` if it failed.
 
-        return r
+        Example:
+        -------
+        >>> client = secmail.Client(host=["www.1secmail.com", "mirror.example.com"])
+        >>> client.check_hosts()
+        {'www.1secmail.com': 0.084, 'mirror.example.com': None}
+
+        """
+        failover = _failover_errors()
+        latencies = {}
+        for host in self.hosts.hosts:
+            started = time.monotonic()
+            try:
+                self._send_to(host, GET_DOMAIN_LIST)
+            except failover:
+                latencies[host] = None
+            except Exception:
+                self.hosts.record_failure(host)
+                latencies[host] = None
+            else:
+                latencies[host] = time.monotonic() - started
+        return latencies
+
+    def _request(self, action: str, params=None, data_type=None):
+        r = self._send(action, params)
+
+        if action == DOWNLOAD:
+            return r.content
+
+        return _decode(r, data_type)
 
     def random_email(self, amount: int, domain: str = None) -> List[str]:
         """This method generates a list of random email addresses.
@@ -178,7 +654,7 @@ class Client:
         If `domain` is provided and not in the valid list of domains, a ValueError will be raised with a message indicating the invalid domain and the valid list of domains.
 
         """
-        if domain is not None and domain not in self.domain_list:
+        if domain is not None and domain not in self.domain_set:
             err_msg = f"{domain} is not a valid domain name.\nValid Domains: {self.domain_list}"
             raise ValueError(err_msg)
 
@@ -224,7 +700,7 @@ class Client:
         If `domain` is provided and not in the valid list of domains, a ValueError will be raised with a message indicating the invalid domain and the valid list of domains.
 
         """
-        if domain is not None and domain not in self.domain_list:
+        if domain is not None and domain not in self.domain_set:
             err_msg = f"{domain} is not a valid domain name.\nValid Domains: {self.domain_list}"
             raise ValueError(err_msg)
 
@@ -234,13 +710,21 @@ class Client:
 
         return f"{username}@{domain or random.choice(self.domain_list)}"
 
-    def await_new_message(self, address: str, fetch_interval=5) -> Inbox:
+    def await_new_message(
+        self,
+        address: str,
+        fetch_interval=5,
+        checkpoint: "CheckpointStore" = None,
+        timeout: float = None,
+    ) -> Inbox:
         """This method waits until a new message is received for the specified email address.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for new messages.
         - `fetch_interval`: `int` (optional) - The time interval (in seconds) for checking new messages. The default value is 5 seconds.
+        - `checkpoint`: `CheckpointStore` (optional) - Persists the seen message ids of the address. If the address was checkpointed before, waiting resumes from that state and messages received in the meantime count as new.
+        - `timeout`: `float` (optional) - Seconds to wait at most, a `DeadlineExceededError` is raised once they passed. By default the method waits until a message arrives.
 
         Returns:
         -------
@@ -254,20 +738,86 @@ class Client:
 
         The method will continuously check for new messages every `fetch_interval` seconds until a new message is received. Once a new message is received, the message object is returned. The method also maintains a set of message IDs to check if the message is new. If the same message is received again, the method will continue to wait for a new message.
 
-        Note that if no new messages are received for a long time, the method may take a long time to return.
+        Note that if no new messages are received for a long time, the method may take a long time to return, pass `timeout` to bound the wait.
 
         """
-        ids = {message.id for message in self.get_inbox(address)}
-        while True:
-            time.sleep(fetch_interval)
-            new_messages = self.get_inbox(address)
-            for message in new_messages:
-                if message.id not in ids:
+        with deadline(timeout):
+            ids, fingerprint = self._seen_ids(address, checkpoint)
+            while True:
+                if fingerprint is not None:
+                    time.sleep(_sleep_time(fetch_interval))
+                new_messages, fingerprint = self.poll_inbox(address, fingerprint)
+                for message in new_messages or ():
+                    if message.id not in ids:
+                        _mark_seen(checkpoint, address, message.id)
+                        return message
+
+    def await_message(
+        self,
+        address: str,
+        where=None,
+        fetch_interval=5,
+        checkpoint: "CheckpointStore" = None,
+        timeout: float = None,
+    ) -> Union[Inbox, Message]:
+        """This method waits until a message matching `where` is received for the specified email address.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for new messages.
+        - `where`: `Where` or `dict` (optional) - Regular expressions for `from_address`, `subject`, `body`, `text_body` or `html_body` the message must match. If not provided, any new message matches.
+        - `fetch_interval`: `int` (optional) - The time interval (in seconds) for checking new messages. The default value is 5 seconds.
+        - `checkpoint`: `CheckpointStore` (optional) - Persists the seen message ids of the address. If the address was checkpointed before, waiting resumes from that state and messages received in the meantime count as new.
+        - `timeout`: `float` (optional) - Seconds to wait at most, a `DeadlineExceededError` is raised once they passed. By default the method waits until a message arrives.
+
+        Returns:
+        -------
+        - `message`: `Inbox` or `Message` - The matching message. A `Message` is returned when `where` has body patterns, since the full message had to be fetched to check them.
+
+        Example:
+        -------
+        Wait for a verification email from "noreply@example.com":
+
+        >>> message = client.await_message(
+        ...     "johndoe@1secmail.com",
+        ...     where={"from_address": "noreply@example.com", "subject": "verify"},
+        ... )
+
+        `from_address` and `subject` are checked against the inbox listing, the message itself is only fetched for rows that already matched them and only when a body pattern is given. Messages which were already in the mailbox when the method was called are ignored.
+
+        """
+        with deadline(timeout):
+            matcher = Matcher()
+            token = matcher.add(address, where)
+            needs_body = matcher.where(token).needs_body
+
+            ids, fingerprint = self._seen_ids(address, checkpoint)
+            while True:
+                if fingerprint is not None:
+                    time.sleep(_sleep_time(fetch_interval))
+                messages, fingerprint = self.poll_inbox(address, fingerprint)
+                for message in messages or ():
+                    if message.id in ids:
+                        continue
+                    ids.add(message.id)
+
+                    if not matcher.match(address, message):
+                        continue
+                    if needs_body:
+                        message = self.get_message(address, message.id)
+                        if not matcher.match_body([token], message):
+                            continue
+
+                    _mark_seen(checkpoint, address, message.id)
                     return message
 
-    def get_active_domains(self) -> List[str]:
+    def get_active_domains(self, timeout: float = None) -> List[str]:
         """This method retrieves a list of currently active domains.
 
+        Parameters:
+        ----------
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
         Returns:
         -------
         - `domains`: `List[str]` - A list of active domains.
@@ -283,14 +833,39 @@ class Client:
         Note that the list of active domains may change over time.
 
         """
-        return self._request(action=GET_DOMAIN_LIST)
+        with deadline(timeout):
+            return self._request(action=GET_DOMAIN_LIST)
+
+    def load_domains(self, timeout: float = None) -> List[str]:
+        """This method fetches the active domains used by `random_email()` and `custom_email()`.
+
+        Parameters:
+        ----------
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `domains`: `List[str]` - A list of active domains, also stored in `domain_list`.
+
+        Example:
+        -------
+        Refresh the domains of a long-running client:
+
+        >>> client.load_domains()
+
+        Without it, the list is fetched on the first access of `domain_list`.
+
+        """
+        self.domain_list = self.get_active_domains(timeout)
+        return self.domain_list
 
-    def get_inbox(self, address: str) -> List[Inbox]:
+    def get_inbox(self, address: str, timeout: float = None) -> List[Inbox]:
         """This method retrieves all the messages in the mailbox for the specified email address.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for messages.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
 
         Returns:
         -------
@@ -305,20 +880,136 @@ class Client:
         The method sends a GET request to the API endpoint to retrieve all the messages in the mailbox for the specified email address. The messages are returned as a list of inbox objects. If there are no messages in the mailbox, an empty list is returned.
 
         """
-        username, domain = address.split("@")
-        return self._request(
-            action=GET_MESSAGES,
-            params={"login": username, "domain": domain},
-            data_type=Inbox,
-        )
+        with deadline(timeout):
+            messages, _ = self.poll_inbox(address)
+            return list(messages) if isinstance(messages, list) else messages
+
+    def poll_inbox(
+        self, address: str, fingerprint: tuple = None, timeout: float = None
+    ):
+        """This method retrieves the mailbox like `get_inbox()`, but tells whether it changed since a previous call.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for messages.
+        - `fingerprint`: `tuple` (optional) - The fingerprint returned by the previous call for this address.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `(messages, fingerprint)`: `Tuple[Optional[List[Inbox]], tuple]` - `messages` is `None` if the response is byte for byte the one `fingerprint` was taken from, otherwise the list of inbox objects. `fingerprint` identifies the current response.
+
+        Example:
+        -------
+        Poll a mailbox and only look at the messages when something changed:
+
+        >>> messages, fingerprint = client.poll_inbox("johndoe@1secmail.com")
+        >>> messages, fingerprint = client.poll_inbox("johndoe@1secmail.com", fingerprint)
+        >>> if messages is not None:
+        ...     print(messages)
+
+        Responses are fingerprinted by length and hash, an unchanged response is neither JSON decoded nor turned into inbox objects again. When several callers poll the same address with fingerprints of their own, a new response is decoded once for all of them and the returned list is shared, it must not be modified.
+
+        """
+        with deadline(timeout):
+            username, domain = self._parse_address(address)
+            r = self._send(GET_MESSAGES, {"login": username, "domain": domain})
+            return self._cached_inbox((username, domain), r, fingerprint)
 
-    def get_message(self, address: str, message_id: int) -> Message:
+    def iter_inbox(
+        self, address: str, seen: Container[int] = None, timeout: float = None
+    ) -> Iterator[Inbox]:
+        """This method yields the messages in the mailbox while the response is still being received.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for messages.
+        - `seen`: `Container[int]` (optional) - Message IDs already known. The listing is newest first, so iteration stops at the first of them without reading the rest of the response.
+        - `timeout`: `float` (optional) - Seconds the whole iteration may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `messages`: `Iterator[Inbox]` - The inbox objects in the order of the listing.
+
+        Example:
+        -------
+        Process the new messages of a large mailbox:
+
+        >>> for message in client.iter_inbox("johndoe@1secmail.com", seen=known_ids):
+        ...     known_ids.add(message.id)
+
+        Unlike `get_inbox()`, the JSON array is decoded incrementally: only the unparsed tail of the response is held in memory, and the first message is yielded as soon as it arrived, whatever the size of the mailbox. Breaking out of the loop closes the response.
+
+        """
+        username, domain = self._parse_address(address)
+        with deadline(timeout):
+            r = self._send(
+                GET_MESSAGES, {"login": username, "domain": domain}, stream=True
+            )
+            left = remaining()
+        expires = None if left is None else time.monotonic() + left
+
+        parser = _ArrayParser()
+        try:
+            try:
+                for chunk in r.iter_bytes():
+                    if expires is not None and time.monotonic() >= expires:
+                        raise _deadline_exceeded()
+                    for item in parser.feed(chunk):
+                        message = Inbox(item)
+                        if seen is not None and message.id in seen:
+                            return
+                        yield message
+            except _failover_errors() as e:
+                if expires is not None and time.monotonic() >= expires:
+                    raise _deadline_exceeded() from e
+                raise
+            for item in parser.close():
+                message = Inbox(item)
+                if seen is not None and message.id in seen:
+                    return
+                yield message
+        finally:
+            r.close()
+
+    def _cached_inbox(self, key: tuple, r, fingerprint: tuple = None):
+        current = _fingerprint(r.content)
+        if fingerprint == current:
+            return None, current
+
+        inbox = self._inbox_cache.get(key, current)
+        if inbox is None:
+            inbox = _decode(r, Inbox)
+            # only addresses being polled are remembered, one-shot reads
+            # such as get_inbox() never fill the cache
+            if fingerprint is not None and isinstance(inbox, list):
+                self._inbox_cache.put(key, current, inbox)
+        return inbox, current
+
+    def _seen_ids(self, address: str, checkpoint: "CheckpointStore" = None):
+        # returns the ids to ignore and, when they were taken from the
+        # current inbox, its fingerprint
+        ids = None if checkpoint is None else checkpoint.load(address)
+        if ids is not None:
+            return ids, None
+
+        messages, fingerprint = self.poll_inbox(address)
+        ids = {message.id for message in messages}
+        if checkpoint is not None:
+            checkpoint.add(address, ids)
+            checkpoint.flush()
+        return ids, fingerprint
+
+    def get_message(
+        self, address: str, message_id: int, timeout: float = None
+    ) -> Message:
         """This method retrieves a detailed message from the mailbox for the specified email address and message ID.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for the message.
         - `message_id`: `int` - The ID of the message to retrieve.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
 
         Returns:
         -------
@@ -333,12 +1024,13 @@ class Client:
         The method sends a GET request to the API endpoint to retrieve the message with the specified ID in the mailbox for the specified email address. The message is returned as a message object.
 
         """
-        username, domain = address.split("@")
-        return self._request(
-            action=GET_SINGLE_MESSAGE,
-            params={"login": username, "domain": domain, "id": message_id},
-            data_type=Message,
-        )
+        with deadline(timeout):
+            username, domain = self._parse_address(address)
+            return self._request(
+                action=GET_SINGLE_MESSAGE,
+                params={"login": username, "domain": domain, "id": message_id},
+                data_type=Message,
+            )
 
     def save_email(self, address: str) -> None:
         """This method saves the specified email address to a JSON file for future use.
@@ -375,7 +1067,9 @@ class Client:
         address: str,
         message_id: int,
         filename: str,
-        save_path: str = current_path + "/config/",
+        save_path: str = None,
+        timeout: float = None,
+        store: "AttachmentStore" = None,
     ):
         """This method downloads an attachment from a message in the mailbox for the specified email address and message ID.
 
@@ -384,11 +1078,13 @@ class Client:
         - `address`: `str` - The email address to check for the message containing the attachment.
         - `message_id`: `int` - The ID of the message containing the attachment to download.
         - `filename`: `str` - The name of the attachment file to download.
-        - `save_path`: `str` - Optional. The path to save the downloaded attachment. Default is the current path + "/config/".
+        - `save_path`: `str` - Optional. The path to save the downloaded attachment. Default is the current working directory + "/config/".
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+        - `store`: `AttachmentStore` (optional) - Keeps the attachment once per distinct content. It is only downloaded if the store does not know it yet, and hardlinked to `save_path` when one is given.
 
         Returns:
         -------
-        - `str` - A string indicating the path and size of the downloaded attachment.
+        - `str` - A string indicating the path and size of the downloaded attachment. With a `store` and no `save_path`, the path of the stored blob.
 
         Example:
         -------
@@ -397,17 +1093,31 @@ class Client:
         >>> download_attachment("johndoe@1secmail.com", 12345, "report.pdf")
 
         """
-        username, domain = address.split("@")
-        attachment = self._request(
-            action=DOWNLOAD,
-            params={
-                "login": username,
-                "domain": domain,
-                "id": message_id,
-                "file": filename,
-            },
-        )
+        username, domain = self._parse_address(address)
+        if store is not None:
+            with deadline(timeout):
+                digest, size = self._store_attachment(
+                    store, username, domain, message_id, filename
+                )
+            if save_path is None:
+                path = store.blob_path(digest)
+            else:
+                path = store.link(digest, save_path + filename)
+            return "Path: (" + path + "), Size: " + str(size) + "B"
+
+        with deadline(timeout):
+            attachment = self._request(
+                action=DOWNLOAD,
+                params={
+                    "login": username,
+                    "domain": domain,
+                    "id": message_id,
+                    "file": filename,
+                },
+            )
 
+        if save_path is None:
+            save_path = default_path()
         if not os.path.exists(self.base_path):
             os.mkdir(self.base_path)
 
@@ -415,6 +1125,44 @@ class Client:
             size = attachment_file.write(attachment)
         return "Path: (" + save_path + filename + "), Size: " + str(size) + "B"
 
+    def _store_attachment(
+        self,
+        store: "AttachmentStore",
+        username: str,
+        domain: str,
+        message_id: int,
+        filename: str,
+    ):
+        address = username + "@" + domain
+        known = store.lookup(address, message_id, filename)
+        if known is not None:
+            return known
+
+        r = self._send(
+            DOWNLOAD,
+            {"login": username, "domain": domain, "id": message_id, "file": filename},
+            stream=True,
+        )
+        writer = store.writer()
+        try:
+            try:
+                for chunk in r.iter_bytes():
+                    _time_left()
+                    writer.write(chunk)
+            except _failover_errors() as e:
+                if _expired():
+                    raise _deadline_exceeded() from e
+                raise
+            digest, size = writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            r.close()
+
+        store.record(address, message_id, filename, digest, size)
+        return digest, size
+
 
 # async client
 
@@ -425,50 +1173,237 @@ class AsyncClient:
     >>> import secmail
     >>> client = secmail.AsyncClient()
 
+    `host` may be a list of mirrors or a `HostPool`: requests go to the
+    fastest healthy host and fail over to the next one on connection
+    errors, 5xx and 429 responses. With `hedge`, a `getMessages` or
+    `readMessage` call still unanswered after the pool's p95 latency is
+    duplicated to a second host, the first response wins and the other
+    request is cancelled.
+
+    `timeout` limits every single request, as in httpx. Calls also take a
+    `timeout` for the whole operation, and `secmail.deadline()` sets one
+    for a block of calls. Requests still in flight when it expires are
+    cancelled.
+
+    The domain list used by `random_email()` and `custom_email()` is
+    fetched on first use. Call `await client.load_domains()` first inside
+    a running event loop, otherwise that first use blocks it.
+
     """
 
     def __init__(
-        self, base_path=current_path + "/config/", host="www.1secmail.com"
+        self,
+        base_path=None,
+        host: Union[str, List[str], HostPool] = "www.1secmail.com",
+        hedge: bool = False,
+        timeout: Optional[float] = 5.0,
     ) -> None:
-        self.base_path = base_path
-        self.api_url = "https://" + host + "/api/v1/"
-        self.client = httpx.AsyncClient()
-        self.__client = Client(base_path, host)
-        self.domain_list = self.__client.get_active_domains()
+        self.base_path = base_path or default_path()
+        self.hosts = _host_pool(host)
+        self.hedge = hedge
+        self.timeout = timeout
+        self._client = None
+        self._closed = False
+        self.__client = Client(self.base_path, self.hosts, timeout=timeout)
+        self._inbox_cache = _InboxCache()
+
+        self._matcher = Matcher()
+        self._waiters = {}
+        self._fingerprints = {}
+        self._poller = None
+
+    @property
+    def client(self):
+        # httpx is only imported once the first request is made
+        if self._client is None:
+            if self._closed:
+                raise RuntimeError("The client was closed.")
+            import httpx
+
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    @property
+    def domain_list(self) -> List[str]:
+        return self.__client.domain_list
+
+    @domain_list.setter
+    def domain_list(self, domain_list: List[str]) -> None:
+        self.__client.domain_list = domain_list
+
+    @property
+    def domain_set(self) -> FrozenSet[str]:
+        return self.__client.domain_set
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Closes the HTTP connections of the client and cancels the pending `await_new_message()` calls.
+
+        The client can also be used as an async context manager, which closes it on exit.
+        """
+        import asyncio
+
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        # a poller cancelled before it ever ran did not cancel them
+        self._fail_waiters()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._closed = True
+        self.__client.close()
+
+    def _parse_address(self, address: str) -> tuple:
+        return self.__client._parse_address(address)
+
+    async def _send(self, action: str, params=None, stream: bool = False):
+        hosts = self.hosts.ranked()
+        if self.hedge and action in _HEDGED and len(hosts) > 1:
+            return await self._send_hedged(hosts, action, params, stream)
+
+        failover = _failover_errors()
+        for host in hosts[:-1]:
+            try:
+                return await self._send_to(host, action, params, stream)
+            except failover:
+                pass
+        return await self._send_to(hosts[-1], action, params, stream)
+
+    async def _send_to(self, host: str, action: str, params=None, stream: bool = False):
+        import asyncio
+
+        left = _time_left()
+        started = time.monotonic()
+        try:
+            request = self.client.send(
+                self.client.build_request(
+                    "GET", self.hosts.url(host) + action, params=params
+                ),
+                stream=stream,
+            )
+            # on expiry wait_for cancels the request, which closes its
+            # connection and hands the slot back to the pool
+            r = await (request if left is None else asyncio.wait_for(request, left))
+            if stream and r.status_code >= 400:
+                await r.aread()
+            _raise_for_status(r)
+        except asyncio.CancelledError:
+            # the losing half of a hedged request, at least this slow
+            self.hosts.record(host, time.monotonic() - started, sample=False)
+            raise
+        except asyncio.TimeoutError:
+            self.hosts.record(host, time.monotonic() - started, sample=False)
+            raise _deadline_exceeded() from None
+        except _failover_errors() as e:
+            if _expired():
+                self.hosts.record(host, time.monotonic() - started, sample=False)
+                raise _deadline_exceeded() from e
+            self.hosts.record_failure(host)
+            raise
+        self.hosts.record(host, time.monotonic() - started)
+        return r
 
-    async def _request(self, action: str, params=None, data_type=None):
-        r = await self.client.request(
-            method="GET", url=self.api_url + action, params=params
-        )
+    async def _send_hedged(
+        self, hosts: List[str], action: str, params=None, stream: bool = False
+    ):
+        import asyncio
+
+        failover = _failover_errors()
+        delay = self.hosts.hedge_delay()
+        untried = list(hosts)
+        tasks = []
+
+        def start(host: str):
+            task = asyncio.ensure_future(self._send_to(host, action, params, stream))
+            tasks.append(task)
+            return task
+
+        pending = {start(untried.pop(0))}
+        hedged = False
+        error = None
+        winner = None
+        try:
+            while pending:
+                timeout = None if hedged or not untried else delay
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    pending.add(start(untried.pop(0)))
+                    continue
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        winner = task
+                        return task.result()
+                    if not isinstance(error, failover):
+                        raise error
+                if not pending and untried:
+                    pending.add(start(untried.pop(0)))
+        finally:
+            for task in pending:
+                task.cancel()
+            # let the cancelled requests release their connections
+            await asyncio.gather(*pending, return_exceptions=True)
+            if stream:
+                # a loser that answered as well still holds its connection
+                for task in tasks:
+                    if task is not winner and not task.cancelled():
+                        if task.exception() is None:
+                            await task.result().aclose()
+        raise error
+
+    async def check_hosts(self) -> Dict[str, Optional[float]]:
+        """This method probes every host concurrently and updates its score in the pool.
 
-        if r.status_code == 400:
-            raise BadRequestError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 401:
-            raise AuthenticationError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 403:
-            raise ForbiddenError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 404:
-            raise NotFoundError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 429:
-            raise RateLimitError(f"HTTP {r.status_code}: {r.text}")
-        if r.status_code == 500:
-            raise ServerError(f"HTTP {r.status_code}: {r.text}")
+        Returns:
+        -------
+        - `latencies`: `Dict[str, Optional[float]]` - The response time of every host in seconds, `None` if it failed.
 
-        if action == DOWNLOAD:
-            return r.content
+        Example:
+        -------
+        >>> client = secmail.AsyncClient(host=["www.1secmail.com", "mirror.example.com"])
+        >>> await client.check_hosts()
+        {'www.1secmail.com': 0.084, 'mirror.example.com': None}
 
-        try:
-            r = r.json()
-        except JSONDecodeError:
-            return r.text
+        """
+        import asyncio
 
-        if data_type is not None:
-            if isinstance(r, list):
-                r = [data_type(result) for result in r]
-            elif r is not None:
-                r = data_type(r)
+        failover = _failover_errors()
 
-        return r
+        async def probe(host: str) -> Optional[float]:
+            started = time.monotonic()
+            try:
+                await self._send_to(host, GET_DOMAIN_LIST)
+            except failover:
+                return None
+            except Exception:
+                self.hosts.record_failure(host)
+                return None
+            return time.monotonic() - started
+
+        latencies = await asyncio.gather(*(probe(host) for host in self.hosts.hosts))
+        return dict(zip(self.hosts.hosts, latencies))
+
+    async def _request(self, action: str, params=None, data_type=None):
+        r = await self._send(action, params)
+
+        if action == DOWNLOAD:
+            return r.content
+
+        return _decode(r, data_type)
 
     def random_email(self, amount: int, domain: str = None) -> List[str]:
         """This method generates a list of random email addresses.
@@ -500,7 +1435,7 @@ class AsyncClient:
         If `domain` is provided and not in the valid list of domains, a ValueError will be raised with a message indicating the invalid domain and the valid list of domains.
 
         """
-        if domain is not None and domain not in self.domain_list:
+        if domain is not None and domain not in self.domain_set:
             err_msg = f"{domain} is not a valid domain name.\nValid Domains: {self.domain_list}"
             raise ValueError(err_msg)
 
@@ -546,7 +1481,7 @@ class AsyncClient:
         If `domain` is provided and not in the valid list of domains, a ValueError will be raised with a message indicating the invalid domain and the valid list of domains.
 
         """
-        if domain is not None and domain not in self.domain_list:
+        if domain is not None and domain not in self.domain_set:
             err_msg = f"{domain} is not a valid domain name.\nValid Domains: {self.domain_list}"
             raise ValueError(err_msg)
 
@@ -556,13 +1491,21 @@ class AsyncClient:
 
         return f"{username}@{domain or random.choice(self.domain_list)}"
 
-    async def await_new_message(self, address: str, fetch_interval=5) -> Inbox:
+    async def await_new_message(
+        self,
+        address: str,
+        fetch_interval=5,
+        checkpoint: "CheckpointStore" = None,
+        timeout: float = None,
+    ) -> Inbox:
         """This method waits until a new message is received for the specified email address.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for new messages.
         - `fetch_interval`: `int` (optional) - The time interval (in seconds) for checking new messages. The default value is 5 seconds.
+        - `checkpoint`: `CheckpointStore` (optional) - Persists the seen message ids of the address. If the address was checkpointed before, waiting resumes from that state and messages received in the meantime count as new.
+        - `timeout`: `float` (optional) - Seconds to wait at most, a `DeadlineExceededError` is raised once they passed. By default the method waits until a message arrives.
 
         Returns:
         -------
@@ -576,20 +1519,192 @@ class AsyncClient:
 
         The method will continuously check for new messages every `fetch_interval` seconds until a new message is received. Once a new message is received, the message object is returned. The method also maintains a set of message IDs to check if the message is new. If the same message is received again, the method will continue to wait for a new message.
 
-        Note that if no new messages are received for a long time, the method may take a long time to return.
+        Note that if no new messages are received for a long time, the method may take a long time to return, pass `timeout` to bound the wait.
 
         """
-        ids = {message.id for message in await self.get_inbox(address)}
-        while True:
-            await asyncio.sleep(fetch_interval)
-            new_messages = await self.get_inbox(address)
-            for message in new_messages:
-                if message.id not in ids:
-                    return message
+        import asyncio
+
+        with deadline(timeout):
+            ids, fingerprint = await self._seen_ids(address, checkpoint)
+            while True:
+                if fingerprint is not None:
+                    await asyncio.sleep(_sleep_time(fetch_interval))
+                new_messages, fingerprint = await self.poll_inbox(address, fingerprint)
+                for message in new_messages or ():
+                    if message.id not in ids:
+                        _mark_seen(checkpoint, address, message.id)
+                        return message
+
+    async def await_message(
+        self,
+        address: str,
+        where=None,
+        fetch_interval=5,
+        checkpoint: "CheckpointStore" = None,
+        timeout: float = None,
+    ) -> Union[Inbox, Message]:
+        """This method waits until a message matching `where` is received for the specified email address.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for new messages.
+        - `where`: `Where` or `dict` (optional) - Regular expressions for `from_address`, `subject`, `body`, `text_body` or `html_body` the message must match. If not provided, any new message matches.
+        - `fetch_interval`: `int` (optional) - The time interval (in seconds) for checking new messages. The default value is 5 seconds.
+        - `checkpoint`: `CheckpointStore` (optional) - Persists the seen message ids of the address. If the address was checkpointed before, waiting resumes from that state and messages received in the meantime count as new.
+        - `timeout`: `float` (optional) - Seconds to wait at most, a `DeadlineExceededError` is raised once they passed. By default the method waits until a message arrives.
+
+        Returns:
+        -------
+        - `message`: `Inbox` or `Message` - The matching message. A `Message` is returned when `where` has body patterns, since the full message had to be fetched to check them.
+
+        Example:
+        -------
+        Wait for a verification email from "noreply@example.com":
 
-    async def get_active_domains(self) -> List[str]:
+        >>> message = await client.await_message(
+        ...     "johndoe@1secmail.com",
+        ...     where={"from_address": "noreply@example.com", "subject": "verify"},
+        ... )
+
+        All pending waiters of a client share one polling task: each address is fetched once per cycle and the patterns of all waiters of an address are evaluated together by a `Matcher`, so thousands of concurrent waiters cost one request per address per cycle. The message itself is only fetched for rows that already matched the header patterns and only when a body pattern is given. Messages which were already in the mailbox when the method was called are ignored.
+
+        """
+        import asyncio
+
+        with deadline(timeout):
+            ids, _ = await self._seen_ids(address, checkpoint)
+
+            future = asyncio.get_running_loop().create_future()
+            token = self._matcher.add(address, where)
+            self._waiters[token] = (future, ids, fetch_interval, checkpoint)
+            # the new waiter has not seen the payload the poller last processed
+            self._fingerprints.pop(address, None)
+
+            if self._poller is None or self._poller.done():
+                self._poller = asyncio.create_task(self._poll_waiters())
+
+            try:
+                left = remaining()
+                if left is None:
+                    return await future
+                return await asyncio.wait_for(future, max(left, 0))
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(
+                    "The deadline passed before a matching message arrived."
+                ) from None
+            finally:
+                self._remove_waiter(token)
+
+    def _remove_waiter(self, token: int) -> None:
+        if self._waiters.pop(token, None) is not None:
+            self._matcher.remove(token)
+
+    async def _poll_waiters(self) -> None:
+        import asyncio
+
+        # shared by all waiters, each of them enforces its own deadline
+        clear_deadline()
+        try:
+            while self._waiters:
+                await asyncio.sleep(min(waiter[2] for waiter in self._waiters.values()))
+
+                addresses = self._matcher.addresses()
+                results = await asyncio.gather(
+                    *(
+                        self.poll_inbox(address, self._fingerprints.get(address))
+                        for address in addresses
+                    ),
+                    return_exceptions=True,
+                )
+                for address, result in zip(addresses, results):
+                    if isinstance(result, BaseException):
+                        await self._resolve_waiters(address, result)
+                        continue
+
+                    inbox, self._fingerprints[address] = result
+                    if inbox is not None:
+                        await self._resolve_waiters(address, inbox)
+
+                for address in list(self._fingerprints):
+                    if address not in self._matcher.by_address:
+                        del self._fingerprints[address]
+        except asyncio.CancelledError:
+            self._fail_waiters()
+            raise
+        except Exception as e:
+            # the waiters would otherwise wait for a poller that is gone
+            self._fail_waiters(e)
+
+    def _fail_waiters(self, exception: Exception = None) -> None:
+        for token in list(self._waiters):
+            if exception is None:
+                self._waiters[token][0].cancel()
+                self._remove_waiter(token)
+            else:
+                self._settle(token, exception=exception)
+
+    def _settle(self, token: int, result=None, exception=None) -> None:
+        if token not in self._waiters:
+            return
+        future, _, _, checkpoint = self._waiters[token]
+        if not future.done():
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                _mark_seen(checkpoint, self._matcher.waiters[token][0], result.id)
+                future.set_result(result)
+        self._remove_waiter(token)
+
+    async def _resolve_waiters(self, address: str, inbox) -> None:
+        tokens = set(self._matcher.by_address.get(address, ()))
+
+        if isinstance(inbox, BaseException):
+            for token in tokens:
+                self._settle(token, exception=inbox)
+            return
+
+        for message in inbox:
+            candidates = []
+            for token in tokens:
+                if token not in self._waiters:
+                    continue
+                ids = self._waiters[token][1]
+                if message.id not in ids:
+                    ids.add(message.id)
+                    candidates.append(token)
+            if not candidates:
+                continue
+
+            needs_body = []
+            for token in self._matcher.match(address, message, candidates):
+                if self._matcher.where(token).needs_body:
+                    needs_body.append(token)
+                else:
+                    self._settle(token, message)
+                    tokens.discard(token)
+            if not needs_body:
+                continue
+
+            try:
+                full_message = await self.get_message(address, message.id)
+            except (SecMailError,) + _failover_errors() as e:
+                for token in needs_body:
+                    self._settle(token, exception=e)
+                    tokens.discard(token)
+                continue
+
+            needs_body = [token for token in needs_body if token in self._waiters]
+            for token in self._matcher.match_body(needs_body, full_message):
+                self._settle(token, full_message)
+                tokens.discard(token)
+
+    async def get_active_domains(self, timeout: float = None) -> List[str]:
         """This method retrieves a list of currently active domains.
 
+        Parameters:
+        ----------
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
         Returns:
         -------
         - `domains`: `List[str]` - A list of active domains.
@@ -605,14 +1720,40 @@ class AsyncClient:
         Note that the list of active domains may change over time.
 
         """
-        return await self._request(action=GET_DOMAIN_LIST)
+        with deadline(timeout):
+            return await self._request(action=GET_DOMAIN_LIST)
+
+    async def load_domains(self, timeout: float = None) -> List[str]:
+        """This method fetches the active domains used by `random_email()` and `custom_email()`.
+
+        Parameters:
+        ----------
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `domains`: `List[str]` - A list of active domains, also stored in `domain_list`.
+
+        Example:
+        -------
+        Load the domains before generating addresses inside a coroutine:
+
+        >>> await client.load_domains()
+        >>> addresses = client.random_email(amount=5)
+
+        `random_email()` and `custom_email()` are synchronous, without this call the first of them fetches the list with a blocking request, which stalls the event loop for its duration.
+
+        """
+        self.domain_list = await self.get_active_domains(timeout)
+        return self.domain_list
 
-    async def get_inbox(self, address: str) -> List[Inbox]:
+    async def get_inbox(self, address: str, timeout: float = None) -> List[Inbox]:
         """This method retrieves all the messages in the mailbox for the specified email address.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for messages.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
 
         Returns:
         -------
@@ -627,20 +1768,143 @@ class AsyncClient:
         The method sends a GET request to the API endpoint to retrieve all the messages in the mailbox for the specified email address. The messages are returned as a list of inbox objects. If there are no messages in the mailbox, an empty list is returned.
 
         """
-        username, domain = address.split("@")
-        return await self._request(
-            action=GET_MESSAGES,
-            params={"login": username, "domain": domain},
-            data_type=Inbox,
-        )
+        with deadline(timeout):
+            messages, _ = await self.poll_inbox(address)
+            return list(messages) if isinstance(messages, list) else messages
+
+    async def poll_inbox(
+        self, address: str, fingerprint: tuple = None, timeout: float = None
+    ):
+        """This method retrieves the mailbox like `get_inbox()`, but tells whether it changed since a previous call.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for messages.
+        - `fingerprint`: `tuple` (optional) - The fingerprint returned by the previous call for this address.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `(messages, fingerprint)`: `Tuple[Optional[List[Inbox]], tuple]` - `messages` is `None` if the response is byte for byte the one `fingerprint` was taken from, otherwise the list of inbox objects. `fingerprint` identifies the current response.
+
+        Example:
+        -------
+        Poll a mailbox and only look at the messages when something changed:
+
+        >>> messages, fingerprint = await client.poll_inbox("johndoe@1secmail.com")
+        >>> messages, fingerprint = await client.poll_inbox("johndoe@1secmail.com", fingerprint)
+        >>> if messages is not None:
+        ...     print(messages)
 
-    async def get_message(self, address: str, message_id: int) -> Message:
+        Responses are fingerprinted by length and hash, an unchanged response is neither JSON decoded nor turned into inbox objects again. When several callers poll the same address with fingerprints of their own, a new response is decoded once for all of them and the returned list is shared, it must not be modified.
+
+        """
+        with deadline(timeout):
+            username, domain = self._parse_address(address)
+            r = await self._send(GET_MESSAGES, {"login": username, "domain": domain})
+            return self._cached_inbox((username, domain), r, fingerprint)
+
+    async def iter_inbox(
+        self, address: str, seen: Container[int] = None, timeout: float = None
+    ) -> AsyncIterator[Inbox]:
+        """This method yields the messages in the mailbox while the response is still being received.
+
+        Parameters:
+        ----------
+        - `address`: `str` - The email address to check for messages.
+        - `seen`: `Container[int]` (optional) - Message IDs already known. The listing is newest first, so iteration stops at the first of them without reading the rest of the response.
+        - `timeout`: `float` (optional) - Seconds the whole iteration may take, a `DeadlineExceededError` is raised once they passed.
+
+        Returns:
+        -------
+        - `messages`: `AsyncIterator[Inbox]` - The inbox objects in the order of the listing.
+
+        Example:
+        -------
+        Process the new messages of a large mailbox:
+
+        >>> async for message in client.iter_inbox("johndoe@1secmail.com", seen=known_ids):
+        ...     known_ids.add(message.id)
+
+        Unlike `get_inbox()`, the JSON array is decoded incrementally: only the unparsed tail of the response is held in memory, and the first message is yielded as soon as it arrived, whatever the size of the mailbox. Breaking out of the loop closes the response once the iterator is closed or garbage collected.
+
+        """
+        import asyncio
+
+        username, domain = self._parse_address(address)
+        with deadline(timeout):
+            r = await self._send(
+                GET_MESSAGES, {"login": username, "domain": domain}, stream=True
+            )
+            left = remaining()
+        expires = None if left is None else time.monotonic() + left
+
+        parser = _ArrayParser()
+        chunks = r.aiter_bytes().__aiter__()
+        try:
+            while True:
+                try:
+                    if expires is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), max(expires - time.monotonic(), 0)
+                        )
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise _deadline_exceeded() from None
+                for item in parser.feed(chunk):
+                    message = Inbox(item)
+                    if seen is not None and message.id in seen:
+                        return
+                    yield message
+            for item in parser.close():
+                message = Inbox(item)
+                if seen is not None and message.id in seen:
+                    return
+                yield message
+        finally:
+            await r.aclose()
+
+    def _cached_inbox(self, key: tuple, r, fingerprint: tuple = None):
+        current = _fingerprint(r.content)
+        if fingerprint == current:
+            return None, current
+
+        inbox = self._inbox_cache.get(key, current)
+        if inbox is None:
+            inbox = _decode(r, Inbox)
+            # only addresses being polled are remembered, one-shot reads
+            # such as get_inbox() never fill the cache
+            if fingerprint is not None and isinstance(inbox, list):
+                self._inbox_cache.put(key, current, inbox)
+        return inbox, current
+
+    async def _seen_ids(self, address: str, checkpoint: "CheckpointStore" = None):
+        # returns the ids to ignore and, when they were taken from the
+        # current inbox, its fingerprint
+        ids = None if checkpoint is None else checkpoint.load(address)
+        if ids is not None:
+            return ids, None
+
+        messages, fingerprint = await self.poll_inbox(address)
+        ids = {message.id for message in messages}
+        if checkpoint is not None:
+            checkpoint.add(address, ids)
+            checkpoint.flush()
+        return ids, fingerprint
+
+    async def get_message(
+        self, address: str, message_id: int, timeout: float = None
+    ) -> Message:
         """This method retrieves a detailed message from the mailbox for the specified email address and message ID.
 
         Parameters:
         ----------
         - `address`: `str` - The email address to check for the message.
         - `message_id`: `int` - The ID of the message to retrieve.
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
 
         Returns:
         -------
@@ -655,12 +1919,13 @@ class AsyncClient:
         The method sends a GET request to the API endpoint to retrieve the message with the specified ID in the mailbox for the specified email address. The message is returned as a message object.
 
         """
-        username, domain = address.split("@")
-        return await self._request(
-            action=GET_SINGLE_MESSAGE,
-            params={"login": username, "domain": domain, "id": message_id},
-            data_type=Message,
-        )
+        with deadline(timeout):
+            username, domain = self._parse_address(address)
+            return await self._request(
+                action=GET_SINGLE_MESSAGE,
+                params={"login": username, "domain": domain, "id": message_id},
+                data_type=Message,
+            )
 
     async def save_email(self, address: str) -> None:
         """This method saves the specified email address to a JSON file for future use.
@@ -697,7 +1962,9 @@ class AsyncClient:
         address: str,
         message_id: int,
         filename: str,
-        save_path: str = current_path + "/config/",
+        save_path: str = None,
+        timeout: float = None,
+        store: "AttachmentStore" = None,
     ):
         """This method downloads an attachment from a message in the mailbox for the specified email address and message ID.
 
@@ -706,11 +1973,13 @@ class AsyncClient:
         - `address`: `str` - The email address to check for the message containing the attachment.
         - `message_id`: `int` - The ID of the message containing the attachment to download.
         - `filename`: `str` - The name of the attachment file to download.
-        - `save_path`: `str` - Optional. The path to save the downloaded attachment. Default is the current path + "/config/".
+        - `save_path`: `str` - Optional. The path to save the downloaded attachment. Default is the current working directory + "/config/".
+        - `timeout`: `float` (optional) - Seconds the whole call may take, a `DeadlineExceededError` is raised once they passed.
+        - `store`: `AttachmentStore` (optional) - Keeps the attachment once per distinct content. It is only downloaded if the store does not know it yet, and hardlinked to `save_path` when one is given.
 
         Returns:
         -------
-        - `str` - A string indicating the path and size of the downloaded attachment.
+        - `str` - A string indicating the path and size of the downloaded attachment. With a `store` and no `save_path`, the path of the stored blob.
 
         Example:
         -------
@@ -719,20 +1988,78 @@ class AsyncClient:
         >>> await download_attachment("johndoe@1secmail.com", 12345, "report.pdf")
 
         """
-        username, domain = address.split("@")
-        attachment = await self._request(
-            action=DOWNLOAD,
-            params={
-                "login": username,
-                "domain": domain,
-                "id": message_id,
-                "file": filename,
-            },
-        )
+        username, domain = self._parse_address(address)
+        if store is not None:
+            with deadline(timeout):
+                digest, size = await self._store_attachment(
+                    store, username, domain, message_id, filename
+                )
+            if save_path is None:
+                path = store.blob_path(digest)
+            else:
+                path = store.link(digest, save_path + filename)
+            return "Path: (" + path + "), Size: " + str(size) + "B"
+
+        with deadline(timeout):
+            attachment = await self._request(
+                action=DOWNLOAD,
+                params={
+                    "login": username,
+                    "domain": domain,
+                    "id": message_id,
+                    "file": filename,
+                },
+            )
 
+        if save_path is None:
+            save_path = default_path()
         if not os.path.exists(self.base_path):
             os.mkdir(self.base_path)
 
         with open(save_path + filename, "wb") as attachment_file:
             size = attachment_file.write(attachment)
         return "Path: (" + save_path + filename + "), Size: " + str(size) + "B"
+
+    async def _store_attachment(
+        self,
+        store: "AttachmentStore",
+        username: str,
+        domain: str,
+        message_id: int,
+        filename: str,
+    ):
+        import asyncio
+
+        address = username + "@" + domain
+        known = store.lookup(address, message_id, filename)
+        if known is not None:
+            return known
+
+        r = await self._send(
+            DOWNLOAD,
+            {"login": username, "domain": domain, "id": message_id, "file": filename},
+            stream=True,
+        )
+        writer = store.writer()
+
+        async def read_body() -> None:
+            async for chunk in r.aiter_bytes():
+                writer.write(chunk)
+
+        try:
+            left = remaining()
+            try:
+                await (
+                    read_body() if left is None else asyncio.wait_for(read_body(), left)
+                )
+            except asyncio.TimeoutError:
+                raise _deadline_exceeded() from None
+            digest, size = writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            await r.aclose()
+
+        store.record(address, message_id, filename, digest, size)
+        return digest, size
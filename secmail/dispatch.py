@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import asyncio
+import inspect
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Union
+
+from .checkpoint import CheckpointStore
+from .client import AsyncClient, DeliveryError, _check_inbox
+from .models import Inbox, Message
+
+
+# events
+
+
+class Event:
+    """The event object is pushed to sinks for every new message.
+
+    ---
+
+    Attributes:
+    ----------
+
+    - address : (``str``) - The email address the message was received on
+
+    - message : (``Inbox`` or ``Message``) - The new message, a full `Message` when the dispatcher fetches bodies
+
+    """
+
+    __slots__ = ("address", "message")
+
+    def __init__(self, address: str, message: Union[Inbox, Message]) -> None:
+        self.address = address
+        self.message = message
+
+    @property
+    def key(self) -> tuple:
+        return (self.address, self.message.id)
+
+    def to_dict(self) -> dict:
+        return {"address": self.address, **self.message.to_dict()}
+
+    def __repr__(self) -> str:
+        return f"Event(address={self.address}, message={self.message})"
+
+
+# sinks
+
+
+class Sink(ABC):
+    """Base class of the dispatcher's sinks.
+
+    `send()` receives a batch of events and must raise if the batch was not
+    delivered, the dispatcher then retries the same batch. A subclass that
+    does not implement it cannot be instantiated.
+    """
+
+    @abstractmethod
+    async def send(self, events: List[Event]) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class QueueSink(Sink):
+    """Puts every event into an `asyncio.Queue`, a bounded queue throttles the dispatcher."""
+
+    def __init__(self, queue: asyncio.Queue = None) -> None:
+        self.queue = queue if queue is not None else asyncio.Queue()
+
+    async def send(self, events: List[Event]) -> None:
+        for event in events:
+            await self.queue.put(event)
+
+
+class CallbackSink(Sink):
+    """Calls `callback(events)` for every batch, `callback` may be a coroutine function."""
+
+    def __init__(self, callback) -> None:
+        self.callback = callback
+
+    async def send(self, events: List[Event]) -> None:
+        result = self.callback(events)
+        if inspect.isawaitable(result):
+            await result
+
+
+class WebhookSink(Sink):
+    """POSTs every batch as a JSON array to `url`, any non 2xx response is retried."""
+
+    def __init__(self, url: str, headers: dict = None, timeout: float = 10) -> None:
+        import httpx
+
+        self.url = url
+        self.client = httpx.AsyncClient(headers=headers, timeout=timeout)
+
+    async def send(self, events: List[Event]) -> None:
+        r = await self.client.post(self.url, json=[event.to_dict() for event in events])
+        r.raise_for_status()
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class FileSink(Sink):
+    """Appends every event as a JSON line to `path`."""
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.file = open(path, "a", encoding="utf-8")
+
+    async def send(self, events: List[Event]) -> None:
+        self.file.write(
+            "".join(
+                json.dumps(event.to_dict(), ensure_ascii=False) + "\n"
+                for event in events
+            )
+        )
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    async def close(self) -> None:
+        self.file.close()
+
+
+# dispatcher
+
+
+class _Route:
+    """The bounded queue and dedupe window in front of one sink."""
+
+    def __init__(self, sink: Sink, max_pending: int, dedupe_size: int) -> None:
+        self.sink = sink
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.delivered: OrderedDict = OrderedDict()
+        self.dedupe_size = dedupe_size
+        # the batch being sent or retried
+        self.batch: List[Event] = []
+
+    def is_delivered(self, event: Event) -> bool:
+        return event.key in self.delivered
+
+    def mark_delivered(self, events: List[Event]) -> None:
+        for event in events:
+            self.delivered[event.key] = None
+            self.delivered.move_to_end(event.key)
+        while len(self.delivered) > self.dedupe_size:
+            self.delivered.popitem(last=False)
+
+
+class Dispatcher:
+    """Polls addresses and pushes new messages to sinks.
+
+    >>> client = secmail.AsyncClient()
+    >>> queue = asyncio.Queue(100)
+    >>> async with secmail.Dispatcher(client, [secmail.QueueSink(queue)], addresses):
+    ...     event = await queue.get()
+
+    Each sink has its own bounded queue. When a sink falls behind its queue
+    fills up and polling waits for it, so a slow sink throttles the
+    dispatcher instead of growing memory. Events are delivered in batches
+    of up to `batch_size`, a failed batch is retried with exponential
+    backoff until it succeeds, so delivery is at-least-once. Events already
+    delivered to a sink are dropped by message id.
+
+    With a `checkpoint`, a message id is persisted once every sink has
+    delivered its event, so a restarted dispatcher resumes where it left
+    off, including messages received while it was down.
+
+    `stop()` waits at most `drain_timeout` seconds for the queues to drain,
+    so a sink that keeps failing cannot block shutdown. Events still queued
+    then are recorded in `errors` as a `DeliveryError` per sink, and are
+    not checkpointed.
+
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        sinks: Iterable[Sink],
+        addresses: Iterable[str] = (),
+        fetch_interval=5,
+        full: bool = False,
+        include_existing: bool = False,
+        concurrency: int = 32,
+        batch_size: int = 100,
+        batch_interval: float = 1.0,
+        max_pending: int = 1000,
+        dedupe_size: int = 100000,
+        max_backoff: float = 60,
+        checkpoint: CheckpointStore = None,
+        drain_timeout: float = 30,
+    ) -> None:
+        self.client = client
+        self.sinks = list(sinks)
+        self.addresses = list(dict.fromkeys(addresses))
+        self.fetch_interval = fetch_interval
+        self.full = full
+        self.include_existing = include_existing
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_pending = max_pending
+        self.dedupe_size = dedupe_size
+        self.max_backoff = max_backoff
+        self.checkpoint = checkpoint
+        self.drain_timeout = drain_timeout
+
+        self.seen = {}
+        self.fingerprints = {}
+        self.errors = deque(maxlen=1000)
+        self._routes: List[_Route] = []
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: Dict[tuple, int] = {}
+
+    async def __aenter__(self) -> "Dispatcher":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def add_address(self, address: str) -> None:
+        if address not in self.addresses:
+            self.addresses.append(address)
+
+    def remove_address(self, address: str) -> None:
+        if address in self.addresses:
+            self.addresses.remove(address)
+        self.seen.pop(address, None)
+        self.fingerprints.pop(address, None)
+
+    def start(self) -> None:
+        if self.checkpoint is not None:
+            self.seen.update(self.checkpoint.load_many(self.addresses))
+        self._routes = [
+            _Route(sink, self.max_pending, self.dedupe_size) for sink in self.sinks
+        ]
+        self._tasks = [asyncio.create_task(self._poll_forever())]
+        self._tasks += [
+            asyncio.create_task(self._deliver_forever(route)) for route in self._routes
+        ]
+
+    async def stop(self, drain: bool = True) -> None:
+        """Stops polling, then waits up to `drain_timeout` seconds until the queued events are delivered when `drain` is set."""
+        if not self._tasks:
+            return
+        poller, *deliverers = self._tasks
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+
+        if drain:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(route.queue.join() for route in self._routes)),
+                    self.drain_timeout,
+                )
+            except asyncio.TimeoutError:
+                pass
+        for task in deliverers:
+            task.cancel()
+        await asyncio.gather(*deliverers, return_exceptions=True)
+
+        for route in self._routes:
+            # a sink that kept failing or was not drained, keep the events
+            # in `errors` rather than dropping them silently
+            events = list(route.batch)
+            while not route.queue.empty():
+                events.append(route.queue.get_nowait())
+            if events:
+                message = f"{len(events)} events were not delivered before stopping."
+                self.errors.append(
+                    (type(route.sink).__name__, DeliveryError(message, events))
+                )
+            await route.sink.close()
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
+        self._tasks = []
+
+    async def run(self) -> None:
+        """Runs until cancelled."""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop(drain=False)
+
+    # polling
+
+    async def _publish(self, event: Event) -> None:
+        routes = [route for route in self._routes if not route.is_delivered(event)]
+        if not routes:
+            self._acknowledge(event)
+            return
+
+        self._inflight[event.key] = self._inflight.get(event.key, 0) + len(routes)
+        for route in routes:
+            # blocks while the sink is behind
+            await route.queue.put(event)
+
+    def _acknowledge(self, event: Event) -> None:
+        remaining = self._inflight.pop(event.key, 1) - 1
+        if remaining > 0:
+            self._inflight[event.key] = remaining
+        elif self.checkpoint is not None:
+            self.checkpoint.add(event.address, [event.message.id])
+
+    async def _poll(self, address: str, semaphore: asyncio.Semaphore) -> None:
+        try:
+            await self._poll_address(address, semaphore)
+        except Exception as e:
+            # a bad response or a failing checkpoint only costs this address
+            # a cycle, polling goes on
+            self.errors.append((address, e))
+
+    async def _poll_address(self, address: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            inbox, fingerprint = await self.client.poll_inbox(
+                address, self.fingerprints.get(address)
+            )
+
+        if address not in self.addresses or _check_inbox(inbox) is None:
+            return
+        ids = self.seen.get(address)
+        if ids is None:
+            ids = self.seen[address] = set()
+            if not self.include_existing:
+                ids.update(message.id for message in inbox)
+                self.fingerprints[address] = fingerprint
+                if self.checkpoint is not None:
+                    self.checkpoint.add(address, ids)
+                return
+        elif self.checkpoint is not None and len(ids) > len(inbox):
+            # messages expired from the mailbox, forget their ids
+            ids.intersection_update(message.id for message in inbox)
+            self.checkpoint.retain(address, ids)
+
+        complete = True
+        for message in inbox:
+            if message.id in ids:
+                continue
+            if self.full:
+                try:
+                    async with semaphore:
+                        message = await self.client.get_message(address, message.id)
+                except Exception as e:
+                    # not marked as seen, the next cycle tries again
+                    self.errors.append((address, e))
+                    complete = False
+                    continue
+            await self._publish(Event(address, message))
+            ids.add(message.id)
+
+        # an identical payload is only skipped once all of its rows went out
+        if complete:
+            self.fingerprints[address] = fingerprint
+
+    async def _poll_forever(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            started = time.monotonic()
+            await asyncio.gather(
+                *(self._poll(address, semaphore) for address in list(self.addresses))
+            )
+            if self.checkpoint is not None:
+                try:
+                    self.checkpoint.flush_if_due()
+                except Exception as e:
+                    self.errors.append(("checkpoint", e))
+            await asyncio.sleep(
+                max(0, self.fetch_interval - (time.monotonic() - started))
+            )
+
+    # delivery
+
+    async def _next_batch(self, route: _Route) -> List[Event]:
+        batch = route.batch = [await route.queue.get()]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(route.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver_forever(self, route: _Route) -> None:
+        while True:
+            batch = await self._next_batch(route)
+            events = [event for event in batch if not route.is_delivered(event)]
+            route.batch = events
+
+            backoff = min(0.5, self.max_backoff)
+            while events:
+                try:
+                    await route.sink.send(events)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors.append((type(route.sink).__name__, e))
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                else:
+                    route.mark_delivered(events)
+                    break
+            route.batch = []
+
+            for event in batch:
+                try:
+                    self._acknowledge(event)
+                except Exception as e:
+                    # like after a crash, the message is reported again
+                    # after a restart
+                    self.errors.append(("checkpoint", e))
+                route.queue.task_done()
@@ -0,0 +1,185 @@
+import re
+import asyncio
+
+from html import unescape
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional
+
+from .models import Message
+
+
+CODE_PATTERN = r"(?<![\w-])\d{4,8}(?![\w-])"
+LINK_PATTERN = r"https?://[^\s\"'<>]+"
+MAGIC_LINK_PATTERN = (
+    r"(?i)verif|confirm|activat|magic|token|auth|login|signin|sign-in|reset|code"
+)
+
+
+class Extraction:
+    """The extraction object contains what an `Extractor` found in a message.
+
+    ---
+
+    Attributes:
+    ----------
+
+    - id : (``int``) - Message id
+
+    - codes : (``List[str]``) - Numeric codes, in order of appearance
+
+    - links : (``List[str]``) - Links which look like verification or magic links
+
+    - named : (``Dict[str, List[str]]``) - Matches of the extractor's named patterns
+
+    """
+
+    __slots__ = ("id", "codes", "links", "named")
+
+    def __init__(self, id, codes, links, named) -> None:
+        self.id = id
+        self.codes = codes
+        self.links = links
+        self.named = named
+
+    @property
+    def code(self) -> Optional[str]:
+        return self.codes[0] if self.codes else None
+
+    @property
+    def link(self) -> Optional[str]:
+        return self.links[0] if self.links else None
+
+    def __repr__(self) -> str:
+        return f"Extraction(id={self.id}, codes={self.codes}, links={self.links}, named={self.named})"
+
+
+class _TextParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.links = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.links.append(value)
+
+    def handle_endtag(self, tag) -> None:
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data) -> None:
+        if not self._skip:
+            self.text.append(data)
+
+
+def _unique(values: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(values))
+
+
+def _findall(pattern: "re.Pattern", text: str) -> List[str]:
+    group = 1 if pattern.groups else 0
+    return _unique(match.group(group) for match in pattern.finditer(text))
+
+
+class Extractor:
+    """Pulls verification codes and links out of `Message` objects.
+
+    >>> extractor = secmail.Extractor(patterns={"order": r"Order #(\\w+)"})
+    >>> extractor.extract(message).code
+
+    Messages with a `text_body` are scanned directly, the HTML parser only
+    runs for messages which have nothing but an HTML body. The extractor is
+    picklable, so `run()` can hand batches to a `ProcessPoolExecutor` and
+    keep large newsletters off the event loop.
+
+    """
+
+    def __init__(
+        self,
+        patterns: Dict[str, str] = None,
+        code_pattern: str = CODE_PATTERN,
+        link_pattern: str = LINK_PATTERN,
+        magic_link_pattern: str = MAGIC_LINK_PATTERN,
+    ) -> None:
+        self.patterns = {
+            name: re.compile(pattern) for name, pattern in (patterns or {}).items()
+        }
+        self.code_pattern = re.compile(code_pattern)
+        self.link_pattern = re.compile(link_pattern)
+        self.magic_link_pattern = re.compile(magic_link_pattern)
+
+    def _text(self, message: Message):
+        if message.text_body:
+            return message.text_body, ()
+
+        html = message.html_body or message.body or ""
+        if "<" not in html:
+            return html, ()
+
+        parser = _TextParser()
+        parser.feed(html)
+        parser.close()
+        return " ".join(parser.text), parser.links
+
+    def extract(self, message: Message) -> Extraction:
+        """Returns the codes, links and named pattern matches found in `message`."""
+        text, hrefs = self._text(message)
+
+        links = [
+            link
+            for link in _unique(
+                [*hrefs, *map(unescape, self.link_pattern.findall(text))]
+            )
+            if link.startswith(("http://", "https://"))
+            and self.magic_link_pattern.search(link)
+        ]
+        named = {
+            name: _findall(pattern, text) for name, pattern in self.patterns.items()
+        }
+
+        # codes inside links are tokens of the link, not codes on their own
+        code_text = self.link_pattern.sub(" ", text)
+        return Extraction(
+            message.id, _findall(self.code_pattern, code_text), links, named
+        )
+
+    def extract_many(self, messages: Iterable[Message]) -> List[Extraction]:
+        return [self.extract(message) for message in messages]
+
+    async def run(
+        self, messages: List[Message], executor=None, chunk_size: int = 64
+    ) -> List[Extraction]:
+        """Extracts `messages` in `executor` without blocking the event loop.
+
+        Parameters:
+        ----------
+        - `messages`: `List[Message]` - The messages to extract from.
+        - `executor`: `concurrent.futures.Executor` (optional) - The pool to run the extraction in. Use a `ProcessPoolExecutor` to spread CPU heavy extraction over several cores. If not provided, the loop's default thread pool is used.
+        - `chunk_size`: `int` (optional) - The number of messages sent to the pool per task.
+
+        Returns:
+        -------
+        - `extractions`: `List[Extraction]` - One extraction per message, in the same order.
+
+        Example:
+        -------
+        >>> with ProcessPoolExecutor() as pool:
+        ...     results = await extractor.run(messages, executor=pool)
+
+        """
+        loop = asyncio.get_running_loop()
+        chunks = [
+            messages[i : i + chunk_size] for i in range(0, len(messages), chunk_size)
+        ]
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, self.extract_many, chunk)
+                for chunk in chunks
+            )
+        )
+        return [extraction for chunk in results for extraction in chunk]
@@ -0,0 +1,139 @@
+import time
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Union
+
+
+def _api_url(host: str) -> str:
+    # a bare host name means the public API over https, entries with a
+    # scheme and port such as http://127.0.0.1:8001 are used as given
+    if "://" not in host:
+        host = "https://" + host
+    return host.rstrip("/") + "/api/v1/"
+
+
+class _HostStats:
+    __slots__ = ("latency", "failures", "down_until")
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.down_until = 0.0
+
+
+class HostPool:
+    """Scores the API hosts a client can send requests to.
+
+    >>> hosts = secmail.HostPool(["www.1secmail.com", "mirror.example.com"])
+    >>> client = secmail.Client(host=hosts, hedge=True)
+
+    A host is a name reached over https, or a URL with scheme and port
+    such as ``http://127.0.0.1:8001`` for a local mirror.
+
+    Every request reports its latency, hosts are ranked by a moving average
+    of it. A host failing `max_failures` times in a row is skipped for
+    `cooldown` seconds, after which it gets one request again to prove it
+    recovered. `check_hosts()` of the clients probes every host and can be
+    run periodically to keep the scores fresh.
+
+    `hedge_delay()` is the `hedge_quantile` of the recent latencies of all
+    hosts: a hedged request that has not answered by then is duplicated to
+    the next host.
+
+    """
+
+    def __init__(
+        self,
+        hosts: Union[str, Iterable[str]],
+        window: int = 200,
+        cooldown: float = 30.0,
+        max_failures: int = 3,
+        hedge_quantile: float = 0.95,
+        initial_hedge_delay: float = 0.5,
+        min_hedge_delay: float = 0.01,
+    ) -> None:
+        hosts = [hosts] if isinstance(hosts, str) else list(dict.fromkeys(hosts))
+        if not hosts:
+            raise ValueError("at least one host is required")
+
+        self.hosts = hosts
+        self.urls = {host: _api_url(host) for host in hosts}
+        self.stats: Dict[str, _HostStats] = {host: _HostStats() for host in hosts}
+        self.samples: deque = deque(maxlen=window)
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+
+    def __len__(self) -> int:
+        return len(self.hosts)
+
+    def __repr__(self) -> str:
+        return f"HostPool({self.hosts})"
+
+    def url(self, host: str) -> str:
+        return self.urls[host]
+
+    def ranked(self) -> List[str]:
+        """Returns the hosts to try in order, the fastest healthy host first.
+
+        Hosts without a measurement yet rank first so that each one gets
+        tried, hosts cooling down rank last by the time they come back.
+        """
+        now = time.monotonic()
+        healthy = []
+        down = []
+        for host in self.hosts:
+            stats = self.stats[host]
+            if stats.down_until > now:
+                down.append((stats.down_until, host))
+            else:
+                healthy.append((stats.latency or 0.0, host))
+        healthy.sort(key=lambda item: item[0])
+        down.sort(key=lambda item: item[0])
+        return [host for _, host in healthy] + [host for _, host in down]
+
+    def record(self, host: str, latency: float, sample: bool = True) -> None:
+        """Records a response of `host`.
+
+        A request cancelled after `latency` seconds is recorded with
+        `sample=False`: it still weighs on the host's score, but as a lower
+        bound it is kept out of the hedge delay.
+        """
+        stats = self.stats[host]
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency += 0.2 * (latency - stats.latency)
+        if sample:
+            stats.failures = 0
+            stats.down_until = 0.0
+            self.samples.append(latency)
+
+    def record_failure(self, host: str) -> None:
+        stats = self.stats[host]
+        stats.failures += 1
+        if stats.failures >= self.max_failures:
+            stats.down_until = time.monotonic() + self.cooldown
+
+    def is_healthy(self, host: str) -> bool:
+        return self.stats[host].down_until <= time.monotonic()
+
+    def hedge_delay(self) -> float:
+        """Returns how long a hedged request waits before it is duplicated."""
+        if len(self.samples) < 20:
+            return self.initial_hedge_delay
+        samples = sorted(self.samples)
+        delay = samples[int(self.hedge_quantile * (len(samples) - 1))]
+        return max(delay, self.min_hedge_delay)
+
+    def to_dict(self) -> dict:
+        return {
+            host: {
+                "latency": stats.latency,
+                "failures": stats.failures,
+                "healthy": self.is_healthy(host),
+            }
+            for host, stats in self.stats.items()
+        }
@@ -0,0 +1,266 @@
+import re
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import Inbox, Message
+
+
+# predicates
+
+
+class Where:
+    """A predicate describing the message a waiter is interested in.
+
+    Every field is a regular expression (``str`` or compiled ``re.Pattern``)
+    that must be found somewhere in the corresponding message attribute.
+    Fields left as ``None`` match anything.
+
+    ---
+
+    Attributes:
+    ----------
+
+    - from_address : (``str``) - Pattern for the sender email address
+
+    - subject : (``str``) - Pattern for the subject
+
+    - body : (``str``) - Pattern for the message body (html if exists, text otherwise)
+
+    - text_body : (``str``) - Pattern for the text body
+
+    - html_body : (``str``) - Pattern for the html body
+
+    `from_address` and `subject` are checked against `Inbox` rows, the body
+    fields require the full `Message` and are only fetched when the header
+    fields already matched.
+
+    """
+
+    HEADER_FIELDS = ("from_address", "subject")
+    BODY_FIELDS = ("body", "text_body", "html_body")
+
+    __slots__ = HEADER_FIELDS + BODY_FIELDS
+
+    def __init__(
+        self,
+        from_address=None,
+        subject=None,
+        body=None,
+        text_body=None,
+        html_body=None,
+    ) -> None:
+        self.from_address = _compile(from_address)
+        self.subject = _compile(subject)
+        self.body = _compile(body)
+        self.text_body = _compile(text_body)
+        self.html_body = _compile(html_body)
+
+    @classmethod
+    def coerce(cls, where) -> "Where":
+        if where is None:
+            return cls()
+        if isinstance(where, cls):
+            return where
+        if isinstance(where, dict):
+            return cls(**where)
+        raise TypeError(f"where must be a Where or a dict, not {type(where).__name__}")
+
+    @property
+    def needs_body(self) -> bool:
+        return any(getattr(self, field) is not None for field in self.BODY_FIELDS)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{field}={getattr(self, field).pattern!r}"
+            for field in self.__slots__
+            if getattr(self, field) is not None
+        )
+        return f"Where({fields})"
+
+
+def _compile(pattern) -> Optional["re.Pattern"]:
+    if pattern is None or isinstance(pattern, re.Pattern):
+        return pattern
+    return re.compile(pattern)
+
+
+# matcher
+
+_META = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def _literals(pattern: "re.Pattern") -> Tuple[Optional[str], bool]:
+    """Returns the longest literal every match of `pattern` contains, and
+    whether the pattern is nothing but that literal.
+
+    Only the top-level sequence of the pattern is inspected, anything that
+    cannot be analysed yields no literal.
+    """
+    if not isinstance(pattern.pattern, str):
+        return None, False
+    if not pattern.flags & (re.IGNORECASE | re.VERBOSE) and not _META.search(
+        pattern.pattern
+    ):
+        return pattern.pattern or None, bool(pattern.pattern)
+    try:
+        from re import _parser as sre_parse
+    except ImportError:
+        import sre_parse
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+        if parsed.state.flags & re.IGNORECASE:
+            return None, False
+        runs = [[]]
+        pure = True
+        for op, av in parsed:
+            if op == sre_parse.LITERAL:
+                runs[-1].append(chr(av))
+            else:
+                pure = False
+                runs.append([])
+    except Exception:
+        return None, False
+
+    literal = "".join(max(runs, key=len))
+    if not literal:
+        return None, False
+    return literal, pure
+
+
+class _Test:
+    """A pattern prepared for searching: a literal it requires is looked up
+    with ``in`` first, and patterns that are plain literals never reach the
+    regex engine."""
+
+    __slots__ = ("key", "pattern", "literal", "pure")
+
+    def __init__(self, pattern: "re.Pattern") -> None:
+        self.key = (pattern.pattern, pattern.flags)
+        self.pattern = pattern
+        self.literal, self.pure = _literals(pattern)
+
+    def __call__(self, value: str) -> bool:
+        if self.literal is not None:
+            if self.literal not in value:
+                return False
+            if self.pure:
+                return True
+        return self.pattern.search(value) is not None
+
+
+class Matcher:
+    """Resolves many waiters against inbox rows in a single pass.
+
+    >>> matcher = secmail.Matcher()
+    >>> token = matcher.add("johndoe@1secmail.com", Where(subject="verify"))
+    >>> matcher.match("johndoe@1secmail.com", inbox)
+
+    Waiters are indexed by address and, per field, by pattern. Each distinct
+    pattern is searched at most once per row and a miss drops all waiters
+    sharing it at once, so e.g. thousands of waiters on a few senders cost
+    a few searches of `from_address` plus the subjects of the waiters left.
+    Patterns containing a literal are rejected with a substring check
+    before the regex runs.
+
+    """
+
+    def __init__(self) -> None:
+        self.waiters: Dict[int, tuple] = {}
+        self.by_address: Dict[str, Set[int]] = {}
+        # address -> field -> pattern key -> tokens
+        self.index: Dict[str, Dict[str, Dict[tuple, Set[int]]]] = {}
+        self.tests: Dict[tuple, _Test] = {}
+        self.refs: Dict[tuple, int] = {}
+        self._next_token = 0
+
+    def __len__(self) -> int:
+        return len(self.waiters)
+
+    def add(self, address: str, where) -> int:
+        where = Where.coerce(where)
+        token = self._next_token
+        self._next_token += 1
+
+        keys = {}
+        index = self.index.setdefault(address, {})
+        for field in Where.__slots__:
+            pattern = getattr(where, field)
+            if pattern is None:
+                continue
+            key = (pattern.pattern, pattern.flags)
+            if key not in self.tests:
+                self.tests[key] = _Test(pattern)
+                self.refs[key] = 0
+            self.refs[key] += 1
+            index.setdefault(field, {}).setdefault(key, set()).add(token)
+            keys[field] = key
+
+        self.waiters[token] = (address, where, keys)
+        self.by_address.setdefault(address, set()).add(token)
+        return token
+
+    def remove(self, token: int) -> None:
+        address, _, keys = self.waiters.pop(token)
+        index = self.index[address]
+        for field, key in keys.items():
+            owners = index[field][key]
+            owners.discard(token)
+            if not owners:
+                del index[field][key]
+                if not index[field]:
+                    del index[field]
+            self.refs[key] -= 1
+            if not self.refs[key]:
+                del self.tests[key], self.refs[key]
+
+        tokens = self.by_address[address]
+        tokens.discard(token)
+        if not tokens:
+            del self.by_address[address], self.index[address]
+
+    def addresses(self) -> List[str]:
+        return list(self.by_address)
+
+    def where(self, token: int) -> Where:
+        return self.waiters[token][1]
+
+    def _resolve(self, tokens, fields, obj, index=None) -> List[int]:
+        left = set(tokens)
+        for field in fields:
+            if not left:
+                break
+            value = getattr(obj, field)
+            hits = {}
+            patterns = None if index is None else index.get(field)
+            if patterns is not None and len(patterns) < len(left):
+                # fewer patterns than waiters, a miss drops all its waiters
+                for key, owners in patterns.items():
+                    if left.isdisjoint(owners):
+                        continue
+                    if value is None or not self.tests[key](value):
+                        left -= owners
+                continue
+            for token in list(left):
+                key = self.waiters[token][2].get(field)
+                if key is None:
+                    continue
+                hit = hits.get(key)
+                if hit is None:
+                    hit = hits[key] = value is not None and self.tests[key](value)
+                if not hit:
+                    left.discard(token)
+        # oldest waiters first
+        return sorted(left)
+
+    def match(self, address: str, message: Inbox, tokens=None) -> List[int]:
+        """Returns the waiters of `address` whose header predicates match `message`."""
+        if tokens is None:
+            tokens = self.by_address.get(address, ())
+        return self._resolve(
+            tokens, Where.HEADER_FIELDS, message, self.index.get(address)
+        )
+
+    def match_body(self, tokens, message: Message) -> List[int]:
+        """Returns the waiters among `tokens` whose body predicates match `message`."""
+        return self._resolve(tokens, Where.BODY_FIELDS, message)
@@ -25,6 +25,9 @@ class Inbox:
         self.subject = response.get("subject")
         self.date = response.get("date")
 
+    def to_dict(self) -> dict:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
     def __repr__(self) -> str:
         return f"MailBox(id={self.id}, from_address={self.from_address}, subject={self.subject}, date={self.date})"
 
@@ -84,6 +87,14 @@ class Message:
         self.text_body = response.get("textBody")
         self.html_body = response.get("htmlBody")
 
+    def to_dict(self) -> dict:
+        data = {attr: getattr(self, attr) for attr in self.__slots__}
+        if self.attachments is not None:
+            data["attachments"] = [
+                attachment.to_dict() for attachment in self.attachments
+            ]
+        return data
+
     def __repr__(self) -> str:
         return (
             f"Message(id={self.id}, from_address={self.from_address}, subject={self.subject}, "
@@ -115,5 +126,8 @@ class Attachment:
         self.content_type = response.get("contentType")
         self.size = response.get("size")
 
+    def to_dict(self) -> dict:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
     def __repr__(self) -> str:
         return f"Attachment(filename={self.filename}, content_type={self.content_type}, size={self.size})"
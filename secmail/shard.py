@@ -0,0 +1,443 @@
+import time
+import bisect
+import asyncio
+import hashlib
+import multiprocessing
+
+from multiprocessing.connection import wait
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .checkpoint import CheckpointStore
+from .client import AsyncClient, _check_inbox
+from .models import Inbox
+
+
+# consistent hashing
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """A consistent hash ring mapping addresses to workers.
+
+    >>> ring = HashRing([0, 1, 2])
+    >>> ring.get("johndoe@1secmail.com")
+
+    Each node is placed on the ring `replicas` times, so adding or removing
+    a node only moves about `1 / len(nodes)` of the keys.
+
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 100) -> None:
+        self.replicas = replicas
+        self.nodes: Set[int] = set()
+        self.points: List[int] = []
+        self.owners: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, node: int) -> None:
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}:{replica}")
+            bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node: int) -> None:
+        self.nodes.discard(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}:{replica}")
+            self.points.pop(bisect.bisect_left(self.points, point))
+            del self.owners[point]
+
+    def get(self, key: str) -> int:
+        if not self.points:
+            raise LookupError("the hash ring has no nodes")
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+# worker process
+
+
+class _Worker:
+    """Polls the addresses owned by one worker process.
+
+    Commands arrive from the parent over `conn`:
+
+    - ``("add", {address: ids or None})`` - start watching, `None` seeds the
+      seen ids from the first poll
+    - ``("release", [address, ...])`` - stop watching and send the seen ids
+      back as ``("state", {address: ids})``
+    - ``("stop", None)`` - exit after flushing
+
+    New messages are sent back in batches as ``("messages", [(address, Inbox), ...])``,
+    failed polls as ``("errors", [(address, str), ...])`` and the ids seeded
+    from a first poll as ``("baseline", {address: ids})``.
+    """
+
+    def __init__(self, conn, host, fetch_interval, concurrency, batch_size) -> None:
+        self.conn = conn
+        self.host = host
+        self.fetch_interval = fetch_interval
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.seen: Dict[str, Optional[Set[int]]] = {}
+        self.fingerprints: Dict[str, tuple] = {}
+        self.outbox: List[Tuple[str, Inbox]] = []
+        self.errors: List[Tuple[str, str]] = []
+        self.baselines: Dict[str, List[int]] = {}
+        self.stopped = False
+
+    def _commands(self) -> None:
+        while not self.stopped and self.conn.poll():
+            command, payload = self.conn.recv()
+            if command == "add":
+                for address, ids in payload.items():
+                    self.seen[address] = None if ids is None else set(ids)
+            elif command == "release":
+                self._flush()
+                state = {}
+                for address in payload:
+                    ids = self.seen.pop(address, None)
+                    self.fingerprints.pop(address, None)
+                    state[address] = None if ids is None else list(ids)
+                self.conn.send(("state", state))
+            elif command == "stop":
+                self.stopped = True
+
+    def _flush(self) -> None:
+        if self.baselines:
+            self.conn.send(("baseline", self.baselines))
+            self.baselines = {}
+        if self.outbox:
+            self.conn.send(("messages", self.outbox))
+            self.outbox = []
+        if self.errors:
+            self.conn.send(("errors", self.errors))
+            self.errors = []
+
+    async def _poll(self, address: str) -> None:
+        try:
+            await self._poll_address(address)
+        except Exception as e:
+            # a bad response only costs this address a cycle, polling goes on
+            self.errors.append((address, f"{type(e).__name__}: {e}"))
+
+    async def _poll_address(self, address: str) -> None:
+        async with self.semaphore:
+            if address not in self.seen:
+                return
+            inbox, fingerprint = await self.client.poll_inbox(
+                address, self.fingerprints.get(address)
+            )
+
+        # the address may have been released while the request was in flight
+        if address not in self.seen or _check_inbox(inbox) is None:
+            return
+        self.fingerprints[address] = fingerprint
+        ids = self.seen[address]
+        if ids is None:
+            self.seen[address] = {message.id for message in inbox}
+            self.baselines[address] = list(self.seen[address])
+            return
+
+        for message in inbox:
+            if message.id not in ids:
+                ids.add(message.id)
+                self.outbox.append((address, message))
+        if len(self.outbox) >= self.batch_size:
+            self._flush()
+
+    async def run(self) -> None:
+        self.client = AsyncClient(host=self.host)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            while not self.stopped:
+                started = time.monotonic()
+                self._commands()
+                await asyncio.gather(
+                    *(self._poll(address) for address in list(self.seen))
+                )
+                self._flush()
+
+                while not self.stopped:
+                    remaining = self.fetch_interval - (time.monotonic() - started)
+                    if remaining <= 0:
+                        break
+                    await asyncio.sleep(min(remaining, 0.05))
+                    self._commands()
+        finally:
+            self._flush()
+            await self.client.aclose()
+            self.conn.close()
+
+
+def _worker_main(conn, host, fetch_interval, concurrency, batch_size) -> None:
+    worker = _Worker(conn, host, fetch_interval, concurrency, batch_size)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+# watcher
+
+
+class ShardedWatcher:
+    """Watches a large number of addresses from several worker processes.
+
+    >>> with secmail.ShardedWatcher(addresses, workers=8) as watcher:
+    ...     for address, message in watcher:
+    ...         print(address, message.subject)
+
+    Addresses are spread across the workers by consistent hashing. Every
+    worker runs its own `AsyncClient` and event loop, so JSON decoding and
+    `Inbox` construction scale with the number of cores. New messages are
+    sent back to the parent in batches over one pipe per worker.
+
+    When a worker is added or removed, only the addresses whose owner
+    changed are moved, together with the message ids already seen for
+    them, so a rebalance neither repeats nor drops messages.
+
+    With a `checkpoint`, the seen ids are loaded on start and every message
+    returned by `poll()` is recorded, so a restarted watcher reports the
+    messages received while it was down instead of taking a new baseline.
+
+    """
+
+    def __init__(
+        self,
+        addresses: Iterable[str] = (),
+        workers: int = None,
+        fetch_interval=5,
+        concurrency: int = 64,
+        batch_size: int = 256,
+        host="www.1secmail.com",
+        replicas: int = 100,
+        mp_context=None,
+        checkpoint: CheckpointStore = None,
+    ) -> None:
+        self.addresses: Set[str] = set(addresses)
+        self.num_workers = workers or multiprocessing.cpu_count()
+        self.fetch_interval = fetch_interval
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.host = host
+        self.context = mp_context or multiprocessing.get_context()
+        self.checkpoint = checkpoint
+
+        self.ring = HashRing(replicas=replicas)
+        self.workers: Dict[int, tuple] = {}
+        self.draining: Dict[int, tuple] = {}
+        self.releasing: Dict[int, Set[str]] = {}
+        self.errors: List[Tuple[str, str]] = []
+        self._next_worker = 0
+        self._started = False
+
+    def __enter__(self) -> "ShardedWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def __iter__(self) -> Iterator[Tuple[str, Inbox]]:
+        while self.workers:
+            yield from self.poll()
+
+    def _spawn(self) -> int:
+        worker_id = self._next_worker
+        self._next_worker += 1
+
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                self.host,
+                self.fetch_interval,
+                self.concurrency,
+                self.batch_size,
+            ),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self.workers[worker_id] = (process, parent_conn)
+        return worker_id
+
+    def _send(self, worker_id: int, command: str, payload) -> None:
+        worker = self.workers.get(worker_id) or self.draining.get(worker_id)
+        if worker is None:
+            # already lost, e.g. while an earlier command was sent
+            return
+        try:
+            worker[1].send((command, payload))
+        except (BrokenPipeError, EOFError, OSError):
+            self._lost(worker_id)
+
+    def _assign(self, state: Dict[str, Optional[list]]) -> None:
+        by_worker: Dict[int, dict] = {}
+        for address, ids in state.items():
+            if address in self.addresses:
+                by_worker.setdefault(self.ring.get(address), {})[address] = ids
+        for worker_id, payload in by_worker.items():
+            self._send(worker_id, "add", payload)
+
+    def _release(self, moves: Dict[int, List[str]]) -> None:
+        for worker_id, addresses in moves.items():
+            if addresses:
+                self.releasing.setdefault(worker_id, set()).update(addresses)
+                self._send(worker_id, "release", addresses)
+
+    def _lost(self, worker_id: int) -> None:
+        # the worker died, addresses it owned or had not released yet
+        # restart from a fresh baseline on their new owners
+        worker = self.workers.pop(worker_id, None) or self.draining.pop(worker_id)
+        worker[1].close()
+
+        orphans = dict.fromkeys(self.releasing.pop(worker_id, ()))
+        if worker_id in self.ring.nodes:
+            orphans.update(
+                dict.fromkeys(
+                    address
+                    for address in self.addresses
+                    if self.ring.get(address) == worker_id
+                )
+            )
+            self.ring.remove(worker_id)
+        if self.ring.nodes:
+            self._assign(orphans)
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        for _ in range(self.num_workers):
+            self.ring.add(self._spawn())
+        state = dict.fromkeys(self.addresses)
+        if self.checkpoint is not None:
+            for address, ids in self.checkpoint.load_many(self.addresses).items():
+                state[address] = list(ids)
+        self._assign(state)
+
+    def stop(self) -> None:
+        for worker_id in list(self.workers):
+            self._send(worker_id, "stop", None)
+        for process, conn in [*self.workers.values(), *self.draining.values()]:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.workers.clear()
+        self.draining.clear()
+        self.releasing.clear()
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
+
+    def add_addresses(self, addresses: Iterable[str]) -> None:
+        new = [address for address in addresses if address not in self.addresses]
+        self.addresses.update(new)
+        if self._started:
+            state = dict.fromkeys(new)
+            if self.checkpoint is not None:
+                for address, ids in self.checkpoint.load_many(new).items():
+                    state[address] = list(ids)
+            self._assign(state)
+
+    def remove_addresses(self, addresses: Iterable[str]) -> None:
+        moves: Dict[int, List[str]] = {}
+        for address in addresses:
+            if address in self.addresses:
+                self.addresses.discard(address)
+                if self._started:
+                    moves.setdefault(self.ring.get(address), []).append(address)
+        self._release(moves)
+
+    def add_worker(self) -> int:
+        """Starts a new worker and moves the addresses it now owns to it."""
+        before = {address: self.ring.get(address) for address in self.addresses}
+        worker_id = self._spawn()
+        self.ring.add(worker_id)
+
+        moves: Dict[int, List[str]] = {}
+        for address, owner in before.items():
+            if self.ring.get(address) == worker_id:
+                moves.setdefault(owner, []).append(address)
+        self._release(moves)
+        return worker_id
+
+    def remove_worker(self, worker_id: int) -> None:
+        """Stops a worker after handing its addresses over to the others.
+
+        A worker that already died is left alone: its addresses moved to
+        the other workers when it was found lost.
+        """
+        if worker_id not in self.workers:
+            return
+        if len(self.workers) == 1:
+            raise ValueError("cannot remove the last worker")
+        owned = [
+            address for address in self.addresses if self.ring.get(address) == worker_id
+        ]
+        self.ring.remove(worker_id)
+        self._release({worker_id: owned})
+        if worker_id not in self.workers:
+            # lost while releasing, _lost() reassigned its addresses
+            return
+        self._send(worker_id, "stop", None)
+        if worker_id in self.workers:
+            self.draining[worker_id] = self.workers.pop(worker_id)
+
+    def poll(self, timeout: float = None) -> List[Tuple[str, Inbox]]:
+        """Returns the new messages received within `timeout` seconds.
+
+        The returned list holds `(address, Inbox)` pairs. Control replies of
+        the workers, such as the state of released addresses, are handled
+        here as well, so the watcher must be polled regularly.
+
+        """
+        conns = {
+            conn: worker_id
+            for worker_id, (_, conn) in [*self.workers.items(), *self.draining.items()]
+        }
+        messages = []
+        for conn in wait(list(conns), timeout):
+            worker_id = conns[conn]
+            try:
+                while conn.poll():
+                    command, payload = conn.recv()
+                    if command == "messages":
+                        messages.extend(
+                            (address, message)
+                            for address, message in payload
+                            if address in self.addresses
+                        )
+                    elif command == "baseline":
+                        if self.checkpoint is not None:
+                            for address, ids in payload.items():
+                                self.checkpoint.add(address, ids)
+                    elif command == "errors":
+                        self.errors.extend(payload)
+                    elif command == "state":
+                        self.releasing.get(worker_id, set()).difference_update(payload)
+                        self._assign(payload)
+            except (EOFError, OSError):
+                if worker_id in self.draining and not self.releasing.get(worker_id):
+                    self.draining.pop(worker_id)[0].join()
+                    self.releasing.pop(worker_id, None)
+                    conn.close()
+                else:
+                    self._lost(worker_id)
+
+        if self.checkpoint is not None:
+            for address, message in messages:
+                self.checkpoint.add(address, [message.id])
+            self.checkpoint.flush_if_due()
+        return messages
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+from typing import Optional, Tuple
+
+
+class _BlobWriter:
+    """Hashes an attachment while it is streamed into a temporary file."""
+
+    def __init__(self, store: "AttachmentStore") -> None:
+        self.store = store
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.hash.update(chunk)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> Tuple[str, int]:
+        """Moves the file into the store unless the same content is already there."""
+        if self.store.fsync:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+        digest = self.hash.hexdigest()
+        path = self.store.blob_path(digest)
+        if os.path.exists(path):
+            os.unlink(self.tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # blobs are shared by every link to them, keep them immutable
+            os.chmod(self.tmp_path, 0o444)
+            os.replace(self.tmp_path, path)
+        return digest, self.size
+
+    def abort(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class AttachmentStore:
+    """A content-addressed store for downloaded attachments.
+
+    >>> store = secmail.AttachmentStore("attachments")
+    >>> client.download_attachment("johndoe@1secmail.com", 12345, "report.pdf", store=store)
+
+    Attachments are hashed with SHA-256 while they are streamed to disk and
+    kept once per distinct content under ``blobs/``, however many messages
+    carry them. An sqlite index maps every (address, message id, filename)
+    to its blob, so downloading an attachment the index already knows makes
+    no request at all.
+
+    Blobs are read-only. When a download has a `save_path`, the blob is
+    hardlinked there, or copied where the filesystem cannot link.
+
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.blob_dir = os.path.join(path, "blobs")
+        self.tmp_dir = os.path.join(path, "tmp")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(
+            os.path.join(path, "index.db"), check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS attachments (
+                address TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (address, message_id, filename)
+            ) WITHOUT ROWID
+            """)
+        self.db.commit()
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> "AttachmentStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def lookup(
+        self, address: str, message_id: int, filename: str
+    ) -> Optional[Tuple[str, int]]:
+        """Returns the `(digest, size)` of a stored attachment, `None` if it is unknown."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT digest, size FROM attachments"
+                " WHERE address = ? AND message_id = ? AND filename = ?",
+                (address, int(message_id), filename),
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return row
+
+    def writer(self) -> _BlobWriter:
+        return _BlobWriter(self)
+
+    def record(
+        self, address: str, message_id: int, filename: str, digest: str, size: int
+    ) -> None:
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?, ?)",
+                (address, int(message_id), filename, digest, size),
+            )
+
+    def link(self, digest: str, dest: str) -> str:
+        """Makes the blob available at `dest`, replacing what was there."""
+        source = self.blob_path(digest)
+        if os.path.exists(dest) and os.path.samefile(source, dest):
+            return dest
+
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = dest + ".tmp"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        try:
+            os.link(source, tmp)
+        except OSError:
+            import shutil
+
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+        return dest
+
+    def stats(self) -> dict:
+        """Returns the number of attachments and blobs and the bytes they take."""
+        with self.lock:
+            attachments, referenced = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM attachments"
+            ).fetchone()
+            blobs, stored = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM"
+                " (SELECT digest, MAX(size) AS size FROM attachments GROUP BY digest)"
+            ).fetchone()
+        return {
+            "attachments": attachments,
+            "blobs": blobs,
+            "bytes_referenced": referenced,
+            "bytes_stored": stored,
+        }
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,58 @@
+import time
+
+from contextvars import ContextVar
+from typing import Optional
+
+
+# the monotonic time the innermost deadline expires at
+_deadline = ContextVar("secmail_deadline", default=None)
+
+
+class _Deadline:
+    __slots__ = ("timeout", "token")
+
+    def __init__(self, timeout: Optional[float]) -> None:
+        self.timeout = timeout
+        self.token = None
+
+    def __enter__(self) -> None:
+        if self.timeout is None:
+            return
+        at = time.monotonic() + self.timeout
+        current = _deadline.get()
+        self.token = _deadline.set(at if current is None else min(at, current))
+
+    def __exit__(self, *exc) -> None:
+        if self.token is not None:
+            _deadline.reset(self.token)
+            self.token = None
+
+
+def deadline(timeout: Optional[float]) -> _Deadline:
+    """Limits everything the clients do inside the block to `timeout` seconds.
+
+    >>> with secmail.deadline(30):
+    ...     address = client.random_email(1)[0]
+    ...     message = client.await_new_message(address)
+
+    Requests are sent with the time left as their timeout and cancelled
+    once it runs out, waits stop polling, and `DeadlineExceededError` is
+    raised. Deadlines nest, the nearest one applies, and `None` adds none.
+    The deadline belongs to the current thread or asyncio task, tasks
+    started inside the block inherit it.
+
+    """
+    return _Deadline(timeout)
+
+
+def remaining() -> Optional[float]:
+    """Returns the seconds left until the current deadline, `None` without one."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return at - time.monotonic()
+
+
+def clear_deadline() -> None:
+    """Drops the deadline of the current context, e.g. in a task shared by many callers."""
+    _deadline.set(None)
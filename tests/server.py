@@ -0,0 +1,61 @@
+import json
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def inbox(*ids) -> bytes:
+    return json.dumps(
+        [{"id": i, "from": "a@b.c", "subject": "s", "date": "d"} for i in ids]
+    ).encode()
+
+
+def serve(respond, piece: int = None, pause: float = 0) -> str:
+    """Starts a local server and returns its URL.
+
+    `respond(params)` is called with the query of every request and returns
+    its status and body. With `piece`, the body is sent `piece` bytes at a
+    time, `pause` seconds apart.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def handle(self) -> None:
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # the client gave up on the response
+                pass
+
+        def do_GET(self) -> None:
+            status, body = respond(dict(parse_qsl(urlsplit(self.path).query)))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            for start in range(0, len(body), piece or len(body) or 1):
+                if start:
+                    time.sleep(pause)
+                self.wfile.write(body[start : start + (piece or len(body))])
+                self.wfile.flush()
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def closed() -> str:
+    """Returns the URL of a port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
@@ -0,0 +1,145 @@
+import json
+import random
+import unittest
+
+from json import JSONDecodeError
+from unittest import mock
+
+from secmail.client import _ArrayParser
+
+
+def chunked(data: bytes, sizes) -> list:
+    chunks = []
+    pos = 0
+    for size in sizes:
+        if pos >= len(data):
+            break
+        chunks.append(data[pos : pos + size])
+        pos += size
+    if pos < len(data):
+        chunks.append(data[pos:])
+    return chunks
+
+
+def parse(chunks) -> list:
+    parser = _ArrayParser()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    items.extend(parser.close())
+    return items
+
+
+def splits(data: bytes, seed: int = 0):
+    """Yields the ways a test feeds `data`: whole, byte by byte and randomly split."""
+    yield [data]
+    yield [data[i : i + 1] for i in range(len(data))]
+    rng = random.Random(seed)
+    for _ in range(50):
+        yield chunked(data, iter(lambda: rng.randint(1, 8), None))
+
+
+VALID = [
+    "[]",
+    " [ ] ",
+    "[1]",
+    "[1.5, true]",
+    "[12.5e3]",
+    "[-0.5E-2, 7, 1e+10, 0]",
+    '[{"id": 1, "subject": "café ☃"}, {"id": 2, "subject": "a,b]"}]',
+    '[null, false, "x", [1, [2]], {"a": {"b": []}}]',
+    "\n[\n  1 ,\n  2\n]\n",
+]
+
+INVALID = [
+    '[{"a":1} {"b":2}]',
+    "[1,,2]",
+    "[,1]",
+    '[{"a":1},]',
+    "[1 2]",
+    '{"a": 1}',
+    "[1] 2",
+    "[1",
+    '["abc',
+    "[tru]",
+    "",
+]
+
+
+class ArrayParserTest(unittest.TestCase):
+    def test_valid(self):
+        for text in VALID:
+            data = text.encode()
+            for chunks in splits(data):
+                with self.subTest(text=text, chunks=chunks[:4]):
+                    self.assertEqual(parse(chunks), json.loads(text))
+
+    def test_invalid(self):
+        for text in INVALID:
+            for chunks in splits(text.encode()):
+                with self.subTest(text=text, chunks=chunks[:4]):
+                    with self.assertRaises(JSONDecodeError):
+                        parse(chunks)
+
+    def test_random_inboxes(self):
+        rng = random.Random(1)
+        for seed in range(20):
+            rows = [
+                {
+                    "id": rng.randint(-(10**6), 10**6),
+                    "score": rng.uniform(-1e6, 1e6),
+                    "subject": "".join(rng.choice('ab ,]}"\\é☃') for _ in range(5)),
+                }
+                for _ in range(rng.randint(0, 30))
+            ]
+            data = json.dumps(rows).encode()
+            chunks = chunked(data, iter(lambda: rng.randint(1, 64), None))
+            with self.subTest(seed=seed):
+                self.assertEqual(parse(chunks), rows)
+
+    def test_nested_objects(self):
+        rng = random.Random(2)
+        rows = [
+            {
+                "id": i,
+                "attachments": [{"filename": "a},{b", "size": i}] * (i % 3),
+                "headers": {"x": {"y": "}]"}},
+            }
+            for i in range(30)
+        ]
+        data = json.dumps(rows).encode()
+        for seed in range(20):
+            chunks = chunked(data, iter(lambda: rng.randint(1, 200), None))
+            with self.subTest(seed=seed):
+                self.assertEqual(parse(chunks), rows)
+
+    def test_incomplete_item_is_not_decoded_again(self):
+        parser = _ArrayParser()
+        parser.feed(b'[{"id": 1}, {"id": 2, "subject": "')
+        with mock.patch.object(
+            parser.decoder, "raw_decode", wraps=parser.decoder.raw_decode
+        ) as raw_decode, mock.patch("json.loads", wraps=json.loads) as loads:
+            for _ in range(100):
+                self.assertEqual(parser.feed(b"x" * 10), [])
+            self.assertEqual(raw_decode.call_count + loads.call_count, 0)
+            self.assertEqual(parser.feed(b'"}]'), [{"id": 2, "subject": "x" * 1000}])
+        self.assertEqual(parser.close(), [])
+
+    def test_items_are_returned_as_they_arrive(self):
+        parser = _ArrayParser()
+        self.assertEqual(
+            parser.feed(b'[{"id": 1}, {"id": 2}, {"id"'), [{"id": 1}, {"id": 2}]
+        )
+        self.assertEqual(parser.feed(b": 3}"), [{"id": 3}])
+        self.assertEqual(parser.feed(b", 4"), [])
+        self.assertEqual(parser.feed(b"]"), [4])
+        self.assertEqual(parser.close(), [])
+
+    def test_only_the_tail_is_buffered(self):
+        parser = _ArrayParser()
+        parser.feed(b"[" + b'{"id": 1}, ' * 1000)
+        self.assertLess(len(parser.buffer), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
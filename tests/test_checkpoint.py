@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import httpx
+
+import secmail
+
+
+ADDRESS = "a@1secmail.com"
+
+
+class Mailbox:
+    def __init__(self, *ids) -> None:
+        self.ids = list(ids)
+
+    def __call__(self, request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            json=[
+                {"id": i, "from": "a@b.c", "subject": "s", "date": "d"}
+                for i in self.ids
+            ],
+        )
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "watcher.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def stored(self) -> set:
+        # read through a connection of its own, as another process would
+        db = sqlite3.connect(self.path)
+        try:
+            return set(db.execute("SELECT address, id FROM seen"))
+        finally:
+            db.close()
+
+    def test_resume_after_restart(self):
+        mailbox = Mailbox(1)
+
+        def run_dispatcher(arriving=()) -> list:
+            async def run():
+                client = secmail.AsyncClient()
+                client.client = httpx.AsyncClient(
+                    transport=httpx.MockTransport(mailbox)
+                )
+                received = []
+                with secmail.CheckpointStore(self.path) as checkpoint:
+                    async with secmail.Dispatcher(
+                        client,
+                        [secmail.CallbackSink(received.extend)],
+                        [ADDRESS],
+                        fetch_interval=0.01,
+                        batch_interval=0.01,
+                        checkpoint=checkpoint,
+                    ):
+                        await asyncio.sleep(0.1)
+                        mailbox.ids += arriving
+                        await asyncio.sleep(0.1)
+                return [event.message.id for event in received]
+
+            return asyncio.run(run())
+
+        # 1 was there before the first start and is the baseline
+        self.assertEqual(run_dispatcher(arriving=[2]), [2])
+        # received while the dispatcher was down
+        mailbox.ids += [3, 4]
+        self.assertEqual(run_dispatcher(), [3, 4])
+        self.assertEqual(run_dispatcher(), [])
+
+    def test_resume_await_new_message(self):
+        mailbox = Mailbox(1)
+        client = secmail.Client()
+        client.client = httpx.Client(transport=httpx.MockTransport(mailbox))
+
+        with secmail.CheckpointStore(self.path) as checkpoint:
+            with self.assertRaises(secmail.DeadlineExceededError):
+                client.await_new_message(
+                    ADDRESS, fetch_interval=0.01, checkpoint=checkpoint, timeout=0.1
+                )
+        mailbox.ids += [2, 3]
+
+        received = []
+        for _ in range(2):
+            with secmail.CheckpointStore(self.path) as checkpoint:
+                message = client.await_new_message(
+                    ADDRESS, fetch_interval=0.01, checkpoint=checkpoint, timeout=1
+                )
+                received.append(message.id)
+        self.assertEqual(sorted(received), [2, 3])
+
+    def test_retain(self):
+        with secmail.CheckpointStore(self.path) as checkpoint:
+            checkpoint.add(ADDRESS, [1, 2, 3])
+            checkpoint.flush()
+            checkpoint.retain(ADDRESS, [2, 3])
+            # added after the inbox was read, kept
+            checkpoint.add(ADDRESS, [4])
+            checkpoint.flush()
+            self.assertEqual(checkpoint.load(ADDRESS), {2, 3, 4})
+        self.assertEqual(self.stored(), {(ADDRESS, 2), (ADDRESS, 3), (ADDRESS, 4)})
+
+    def test_flush_size(self):
+        with secmail.CheckpointStore(
+            self.path, flush_interval=60, flush_size=4
+        ) as checkpoint:
+            checkpoint.add(ADDRESS, [1])
+            checkpoint.add(ADDRESS, [2])
+            self.assertEqual(self.stored(), set())
+            # the address and three ids make a batch
+            checkpoint.add(ADDRESS, [3])
+            self.assertEqual(self.stored(), {(ADDRESS, 1), (ADDRESS, 2), (ADDRESS, 3)})
+
+    def test_flush_interval(self):
+        with secmail.CheckpointStore(self.path, flush_interval=0.1) as checkpoint:
+            checkpoint.add(ADDRESS, [1])
+            checkpoint.flush_if_due()
+            self.assertEqual(self.stored(), set())
+            time.sleep(0.15)
+            checkpoint.flush_if_due()
+            self.assertEqual(self.stored(), {(ADDRESS, 1)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+import httpx
+
+import secmail
+
+
+def empty_inbox(request):
+    return httpx.Response(200, json=[])
+
+
+class CloseTest(unittest.TestCase):
+    def test_closed_client_is_not_reopened(self):
+        client = secmail.Client()
+        client.client = httpx.Client(transport=httpx.MockTransport(empty_inbox))
+        self.assertEqual(client.get_inbox("a@1secmail.com"), [])
+        client.close()
+        with self.assertRaises(RuntimeError):
+            client.get_inbox("a@1secmail.com")
+
+    def test_aclose_cancels_waiters(self):
+        async def run():
+            client = secmail.AsyncClient()
+            client.client = httpx.AsyncClient(
+                transport=httpx.MockTransport(empty_inbox)
+            )
+            waiter = asyncio.ensure_future(
+                client.await_message("a@1secmail.com", fetch_interval=0.01)
+            )
+            await asyncio.sleep(0.1)
+            await client.aclose()
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(waiter, 1)
+            self.assertIsNone(client._poller)
+            with self.assertRaises(RuntimeError):
+                await client.get_inbox("a@1secmail.com")
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
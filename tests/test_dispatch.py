@@ -0,0 +1,248 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+import httpx
+
+import secmail
+
+
+class Mailboxes:
+    """Answers getMessages from `inboxes`, a dict of address to message ids."""
+
+    def __init__(self, **inboxes) -> None:
+        self.inboxes = {f"{login}@1secmail.com": ids for login, ids in inboxes.items()}
+        self.requests = 0
+
+    def __call__(self, request) -> httpx.Response:
+        self.requests += 1
+        params = request.url.params
+        ids = self.inboxes.get(f"{params['login']}@{params['domain']}", [])
+        return httpx.Response(
+            200,
+            json=[{"id": i, "from": "a@b.c", "subject": "s", "date": "d"} for i in ids],
+        )
+
+
+def client(handler) -> secmail.AsyncClient:
+    client = secmail.AsyncClient()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def dispatcher(handler, sinks, addresses, **kwargs) -> secmail.Dispatcher:
+    kwargs.setdefault("fetch_interval", 0.01)
+    kwargs.setdefault("batch_interval", 0.01)
+    return secmail.Dispatcher(
+        client(handler), sinks, addresses, include_existing=True, **kwargs
+    )
+
+
+def keys(events) -> list:
+    return [event.key for event in events]
+
+
+class Recorder(secmail.Sink):
+    """Records every batch, the first `failures` calls raise."""
+
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls = []
+        self.events = []
+
+    async def send(self, events) -> None:
+        self.calls.append(time.monotonic())
+        if len(self.calls) <= self.failures:
+            raise RuntimeError("sink down")
+        self.events.extend(events)
+
+
+class DeliveryTest(unittest.TestCase):
+    def test_sink_must_implement_send(self):
+        class Incomplete(secmail.Sink):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        Recorder()
+
+    def test_retry_with_backoff(self):
+        sink = Recorder(failures=2)
+
+        async def run():
+            async with dispatcher(Mailboxes(a=[1, 2]), [sink], ["a@1secmail.com"]):
+                await asyncio.sleep(2)
+
+        asyncio.run(run())
+        self.assertEqual(
+            keys(sink.events), [("a@1secmail.com", 1), ("a@1secmail.com", 2)]
+        )
+        waits = [later - earlier for earlier, later in zip(sink.calls, sink.calls[1:])]
+        self.assertEqual(len(waits), 2)
+        self.assertAlmostEqual(waits[0], 0.5, delta=0.1)
+        self.assertAlmostEqual(waits[1], 1.0, delta=0.1)
+
+    def test_backoff_is_capped(self):
+        sink = Recorder(failures=4)
+
+        async def run():
+            watcher = dispatcher(
+                Mailboxes(a=[1]), [sink], ["a@1secmail.com"], max_backoff=0.05
+            )
+            async with watcher:
+                await asyncio.sleep(0.5)
+            return watcher
+
+        watcher = asyncio.run(run())
+        self.assertEqual(keys(sink.events), [("a@1secmail.com", 1)])
+        waits = [later - earlier for earlier, later in zip(sink.calls, sink.calls[1:])]
+        self.assertLess(max(waits), 0.1)
+        self.assertEqual(
+            [type(e).__name__ for _, e in watcher.errors], ["RuntimeError"] * 4
+        )
+
+    def test_dedupe_by_address_and_id(self):
+        sink = Recorder()
+
+        async def run():
+            watcher = dispatcher(
+                Mailboxes(a=[1], b=[1]), [sink], ["a@1secmail.com", "b@1secmail.com"]
+            )
+            async with watcher:
+                await asyncio.sleep(0.1)
+                # forgets the seen ids, the messages are published again
+                watcher.remove_address("a@1secmail.com")
+                watcher.add_address("a@1secmail.com")
+                await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+        self.assertEqual(
+            sorted(keys(sink.events)), [("a@1secmail.com", 1), ("b@1secmail.com", 1)]
+        )
+
+    def test_bounded_queue_blocks_polling(self):
+        mailboxes = Mailboxes(a=list(range(20)))
+        queue = asyncio.Queue(1)
+
+        async def run():
+            watcher = dispatcher(
+                mailboxes,
+                [secmail.QueueSink(queue)],
+                ["a@1secmail.com"],
+                batch_size=1,
+                max_pending=2,
+            )
+            async with watcher:
+                await asyncio.sleep(0.3)
+                # the sink is stuck on the full queue, the poll loop on the
+                # full route queue in front of it
+                self.assertEqual(mailboxes.requests, 1)
+                self.assertEqual(queue.qsize(), 1)
+                self.assertEqual(watcher._routes[0].queue.qsize(), 2)
+
+                received = [(await queue.get()).message.id for _ in range(20)]
+                self.assertEqual(received, list(range(20)))
+                await asyncio.sleep(0.1)
+                self.assertGreater(mailboxes.requests, 1)
+
+        asyncio.run(run())
+
+    def test_drain_timeout(self):
+        sink = Recorder(failures=10**6)
+
+        async def run():
+            watcher = dispatcher(
+                Mailboxes(a=[1, 2, 3]),
+                [sink],
+                ["a@1secmail.com"],
+                drain_timeout=0.2,
+            )
+            watcher.start()
+            await asyncio.sleep(0.1)
+            started = time.monotonic()
+            await watcher.stop()
+            self.assertLess(time.monotonic() - started, 0.5)
+            return watcher
+
+        watcher = asyncio.run(run())
+        (name, error), *_ = [
+            (name, e)
+            for name, e in watcher.errors
+            if isinstance(e, secmail.DeliveryError)
+        ]
+        self.assertEqual(name, "Recorder")
+        self.assertEqual(
+            keys(error.events),
+            [("a@1secmail.com", 1), ("a@1secmail.com", 2), ("a@1secmail.com", 3)],
+        )
+
+    def test_bad_response_keeps_polling(self):
+        mailboxes = Mailboxes(a=[1])
+
+        def handler(request):
+            if mailboxes.requests < 2:
+                mailboxes.requests += 1
+                return httpx.Response(200, text="not json")
+            return mailboxes(request)
+
+        sink = Recorder()
+
+        async def run():
+            watcher = dispatcher(handler, [sink], ["a@1secmail.com"])
+            async with watcher:
+                await asyncio.sleep(0.2)
+            return watcher
+
+        watcher = asyncio.run(run())
+        self.assertEqual(keys(sink.events), [("a@1secmail.com", 1)])
+        self.assertEqual(
+            [type(e).__name__ for _, e in watcher.errors], ["SecMailError"] * 2
+        )
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = secmail.CheckpointStore(
+            os.path.join(self.directory.name, "watcher.db"), flush_interval=0
+        )
+
+    def tearDown(self):
+        self.checkpoint.close()
+        self.directory.cleanup()
+
+    def test_checkpointed_once_every_sink_delivered(self):
+        fast = Recorder()
+        gate = None
+        slow_events = []
+
+        async def slow(events):
+            await gate.wait()
+            slow_events.extend(events)
+
+        async def run():
+            nonlocal gate
+            gate = asyncio.Event()
+            watcher = dispatcher(
+                Mailboxes(a=[1]),
+                [fast, secmail.CallbackSink(slow)],
+                ["a@1secmail.com"],
+                checkpoint=self.checkpoint,
+            )
+            async with watcher:
+                await asyncio.sleep(0.2)
+                self.assertEqual(keys(fast.events), [("a@1secmail.com", 1)])
+                self.assertFalse(self.checkpoint.load("a@1secmail.com"))
+
+                gate.set()
+                await asyncio.sleep(0.2)
+                self.assertEqual(keys(slow_events), [("a@1secmail.com", 1)])
+                self.assertEqual(self.checkpoint.load("a@1secmail.com"), {1})
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
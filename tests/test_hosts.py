@@ -0,0 +1,160 @@
+import asyncio
+import time
+import unittest
+
+import httpx
+
+import secmail
+
+from server import closed, inbox, serve
+
+
+def respond(*ids, status: int = 200, delay: float = 0):
+    def respond(params):
+        time.sleep(delay)
+        return status, inbox(*ids)
+
+    return respond
+
+
+def ids(messages) -> list:
+    return [message.id for message in messages]
+
+
+class HostPoolTest(unittest.TestCase):
+    def test_fastest_first(self):
+        pool = secmail.HostPool(["a", "b", "c"])
+        pool.record("a", 0.3)
+        pool.record("b", 0.1)
+        # c was never measured and gets tried first
+        self.assertEqual(pool.ranked(), ["c", "b", "a"])
+
+    def test_cooldown(self):
+        pool = secmail.HostPool(["a", "b"], cooldown=0.2, max_failures=2)
+        pool.record("a", 0.1)
+        pool.record("b", 0.3)
+        pool.record_failure("a")
+        self.assertEqual(pool.ranked(), ["a", "b"])
+        pool.record_failure("a")
+        self.assertFalse(pool.is_healthy("a"))
+        self.assertEqual(pool.ranked(), ["b", "a"])
+
+        time.sleep(0.25)
+        self.assertTrue(pool.is_healthy("a"))
+        self.assertEqual(pool.ranked(), ["a", "b"])
+
+    def test_success_ends_cooldown(self):
+        pool = secmail.HostPool(["a", "b"], max_failures=1)
+        pool.record("b", 0.3)
+        pool.record_failure("a")
+        self.assertEqual(pool.ranked(), ["b", "a"])
+        pool.record("a", 0.1)
+        self.assertEqual(pool.ranked(), ["a", "b"])
+
+
+class FailoverTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ok = serve(respond(1))
+        cls.broken = serve(respond(status=503))
+        cls.down = closed()
+
+    def get_inbox(self, hosts):
+        with secmail.Client(host=hosts) as client:
+            return ids(client.get_inbox("a@1secmail.com"))
+
+    def async_get_inbox(self, hosts):
+        async def run():
+            async with secmail.AsyncClient(host=hosts) as client:
+                return ids(await client.get_inbox("a@1secmail.com"))
+
+        return asyncio.run(run())
+
+    def test_server_error(self):
+        for get_inbox in (self.get_inbox, self.async_get_inbox):
+            with self.subTest(get_inbox=get_inbox.__name__):
+                pool = secmail.HostPool([self.broken, self.ok])
+                self.assertEqual(get_inbox(pool), [1])
+                self.assertEqual(pool.stats[self.broken].failures, 1)
+                self.assertEqual(pool.stats[self.ok].failures, 0)
+
+    def test_transport_error(self):
+        for get_inbox in (self.get_inbox, self.async_get_inbox):
+            with self.subTest(get_inbox=get_inbox.__name__):
+                pool = secmail.HostPool([self.down, self.ok])
+                self.assertEqual(get_inbox(pool), [1])
+                self.assertEqual(pool.stats[self.down].failures, 1)
+
+    def test_all_hosts_fail(self):
+        for get_inbox in (self.get_inbox, self.async_get_inbox):
+            with self.subTest(get_inbox=get_inbox.__name__):
+                with self.assertRaises(secmail.ServerError):
+                    get_inbox([self.down, self.broken])
+                with self.assertRaises(httpx.ConnectError):
+                    get_inbox([self.broken, self.down])
+
+    def test_host_cooling_down_is_tried_last(self):
+        pool = secmail.HostPool([self.down, self.ok], max_failures=1)
+        self.get_inbox(pool)
+        self.assertEqual(pool.ranked(), [self.ok, self.down])
+
+
+class HedgeTest(unittest.TestCase):
+    """The first host answers after 0.5 seconds, the hedged request sent to
+    the second one after 0.05 seconds wins."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.slow = serve(respond(1, delay=0.5))
+        cls.fast = serve(respond(2))
+
+    def pool(self):
+        return secmail.HostPool([self.slow, self.fast], initial_hedge_delay=0.05)
+
+    def test_sync(self):
+        with secmail.Client(host=self.pool(), hedge=True) as client:
+            started = time.monotonic()
+            self.assertEqual(ids(client.get_inbox("a@1secmail.com")), [2])
+            self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_sync_stream_loser_is_closed(self):
+        responses = []
+        with secmail.Client(host=self.pool(), hedge=True) as client:
+            client.client = httpx.Client(event_hooks={"response": [responses.append]})
+            started = time.monotonic()
+            self.assertEqual(ids(client.iter_inbox("a@1secmail.com")), [2])
+            self.assertLess(time.monotonic() - started, 0.4)
+
+            # the losing thread ends with the response of the slow host
+            time.sleep(0.6)
+            self.assertEqual(len(responses), 2)
+            self.assertTrue(all(response.is_closed for response in responses))
+
+    def test_async(self):
+        async def run():
+            pool = self.pool()
+            async with secmail.AsyncClient(host=pool, hedge=True) as client:
+                started = time.monotonic()
+                self.assertEqual(ids(await client.get_inbox("a@1secmail.com")), [2])
+                self.assertLess(time.monotonic() - started, 0.4)
+                # the loser was cancelled, its wait is no latency sample
+                self.assertLess(pool.stats[self.slow].latency, 0.4)
+                self.assertEqual(len(pool.samples), 1)
+
+        asyncio.run(run())
+
+    def test_async_stream(self):
+        async def run():
+            async with secmail.AsyncClient(host=self.pool(), hedge=True) as client:
+                started = time.monotonic()
+                messages = [
+                    message async for message in client.iter_inbox("a@1secmail.com")
+                ]
+                self.assertEqual(ids(messages), [2])
+                self.assertLess(time.monotonic() - started, 0.4)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import time
+import unittest
+
+from collections import Counter
+
+import secmail
+
+from server import inbox, serve
+
+
+ADDRESSES = [f"user{i}@1secmail.com" for i in range(30)]
+
+
+class Mailboxes:
+    """The inboxes served to the workers, every address starts with message 1."""
+
+    def __init__(self) -> None:
+        self.inboxes = {address: [1] for address in ADDRESSES}
+
+    def __call__(self, params):
+        return 200, inbox(*self.inboxes[f"{params['login']}@{params['domain']}"])
+
+    def deliver(self, message_id: int) -> None:
+        for ids in self.inboxes.values():
+            ids.append(message_id)
+
+
+def collect(watcher, count: int, timeout: float = 10) -> list:
+    """Polls until `count` messages arrived, then a while longer for duplicates."""
+    messages = []
+    deadline = time.monotonic() + timeout
+    while len(messages) < count and time.monotonic() < deadline:
+        messages += watcher.poll(0.05)
+    settle = time.monotonic() + 0.5
+    while time.monotonic() < settle:
+        messages += watcher.poll(0.05)
+    return [(address, message.id) for address, message in messages]
+
+
+class ShardedWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = secmail.CheckpointStore(
+            os.path.join(self.directory.name, "watcher.db"), flush_interval=0
+        )
+        self.mailboxes = Mailboxes()
+        self.watcher = secmail.ShardedWatcher(
+            ADDRESSES,
+            workers=3,
+            fetch_interval=0.05,
+            host=serve(self.mailboxes),
+            checkpoint=self.checkpoint,
+        )
+        self.sent = []
+        send = self.watcher._send
+
+        def record(worker_id, command, payload):
+            self.sent.append((worker_id, command, payload))
+            send(worker_id, command, payload)
+
+        self.watcher._send = record
+        self.watcher.start()
+        self.wait_for_baselines()
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.checkpoint.close()
+        self.directory.cleanup()
+
+    def wait_for_baselines(self):
+        # the baselines are checkpointed as the workers send them
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            self.assertEqual(self.watcher.poll(0.05), [])
+            if len(self.checkpoint.load_many(ADDRESSES)) == len(ADDRESSES):
+                return
+        self.fail("the workers took no baseline")
+
+    def assertReportedOnce(self, message_id: int):
+        self.mailboxes.deliver(message_id)
+        reported = collect(self.watcher, len(ADDRESSES))
+        self.assertEqual(Counter(reported), Counter((a, message_id) for a in ADDRESSES))
+
+    def commands(self, command: str) -> list:
+        return [
+            (worker, payload) for worker, name, payload in self.sent if name == command
+        ]
+
+    def test_rebalance(self):
+        watcher = self.watcher
+        self.assertReportedOnce(2)
+
+        owners = {address: watcher.ring.get(address) for address in ADDRESSES}
+        self.sent.clear()
+        new_worker = watcher.add_worker()
+        moved = {a for a in ADDRESSES if watcher.ring.get(a) == new_worker}
+        self.assertTrue(0 < len(moved) < len(ADDRESSES))
+        self.assertReportedOnce(3)
+
+        # only the moved addresses were released by their old owners and
+        # handed over with their seen ids
+        released = [
+            a for worker, addresses in self.commands("release") for a in addresses
+        ]
+        self.assertEqual(sorted(released), sorted(moved))
+        for worker, addresses in self.commands("release"):
+            self.assertTrue(all(owners[a] == worker for a in addresses))
+        added = {
+            a: ids
+            for worker, payload in self.commands("add")
+            for a, ids in payload.items()
+        }
+        self.assertEqual(set(added), moved)
+        self.assertTrue(all({1, 2} <= set(ids) for ids in added.values()))
+
+        self.sent.clear()
+        removed = owners[ADDRESSES[0]]
+        owned = {a for a in ADDRESSES if watcher.ring.get(a) == removed}
+        watcher.remove_worker(removed)
+        self.assertReportedOnce(4)
+
+        released = [
+            a for worker, addresses in self.commands("release") for a in addresses
+        ]
+        self.assertEqual(sorted(released), sorted(owned))
+        added = {
+            a: ids
+            for worker, payload in self.commands("add")
+            for a, ids in payload.items()
+        }
+        self.assertEqual(set(added), owned)
+        self.assertTrue(all({1, 2, 3} <= set(ids) for ids in added.values()))
+        self.assertNotIn(removed, watcher.workers)
+
+    def test_lost_worker(self):
+        watcher = self.watcher
+        lost = watcher.ring.get(ADDRESSES[0])
+        orphans = {a for a in ADDRESSES if watcher.ring.get(a) == lost}
+        process, _ = watcher.workers[lost]
+        self.sent.clear()
+        process.kill()
+
+        deadline = time.monotonic() + 5
+        while lost in watcher.workers and time.monotonic() < deadline:
+            watcher.poll(0.05)
+        self.assertNotIn(lost, watcher.workers)
+        self.assertNotIn(lost, watcher.ring.nodes)
+
+        # the orphans start over from a baseline on their new owners
+        added = {
+            a: ids
+            for worker, payload in self.commands("add")
+            for a, ids in payload.items()
+        }
+        self.assertEqual(set(added), orphans)
+        self.assertTrue(all(ids is None for ids in added.values()))
+        # forgotten, so the new baselines show up in the checkpoint
+        for address in orphans:
+            self.checkpoint.forget(address)
+        self.wait_for_baselines()
+        self.assertReportedOnce(2)
+
+        # already gone, nothing to hand over
+        watcher.remove_worker(lost)
+        self.assertEqual(len(watcher.workers), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import httpx
+
+import secmail
+
+
+ADDRESS = "a@1secmail.com"
+
+
+class Attachments:
+    """Serves `files`, a dict of filename to content, and counts the downloads."""
+
+    def __init__(self, **files) -> None:
+        self.files = files
+        self.requests = 0
+
+    def __call__(self, request) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(200, content=self.files[request.url.params["file"]])
+
+
+class FailingStream(httpx.SyncByteStream):
+    def __iter__(self):
+        yield b"partial"
+        raise httpx.ReadError("connection lost")
+
+
+class AttachmentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = secmail.AttachmentStore(os.path.join(self.directory.name, "store"))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def client(self, handler) -> secmail.Client:
+        client = secmail.Client()
+        client.client = httpx.Client(transport=httpx.MockTransport(handler))
+        return client
+
+    def blobs(self) -> list:
+        return [name for _, _, names in os.walk(self.store.blob_dir) for name in names]
+
+    def test_same_content_is_stored_once(self):
+        client = self.client(Attachments(**{"a.pdf": b"report", "b.pdf": b"report"}))
+        client.download_attachment(ADDRESS, 1, "a.pdf", store=self.store)
+        client.download_attachment(ADDRESS, 2, "b.pdf", store=self.store)
+
+        self.assertEqual(len(self.blobs()), 1)
+        self.assertEqual(
+            self.store.lookup(ADDRESS, 1, "a.pdf"),
+            self.store.lookup(ADDRESS, 2, "b.pdf"),
+        )
+        stats = self.store.stats()
+        self.assertEqual((stats["attachments"], stats["blobs"]), (2, 1))
+
+    def test_known_attachment_is_not_downloaded(self):
+        attachments = Attachments(**{"a.pdf": b"report"})
+        client = self.client(attachments)
+        first = client.download_attachment(ADDRESS, 1, "a.pdf", store=self.store)
+        second = client.download_attachment(ADDRESS, 1, "a.pdf", store=self.store)
+        self.assertEqual(first, second)
+        self.assertEqual(attachments.requests, 1)
+
+    def test_known_attachment_is_not_downloaded_async(self):
+        attachments = Attachments(**{"a.pdf": b"report"})
+
+        async def run():
+            async with secmail.AsyncClient() as client:
+                client.client = httpx.AsyncClient(
+                    transport=httpx.MockTransport(attachments)
+                )
+                for _ in range(2):
+                    await client.download_attachment(
+                        ADDRESS, 1, "a.pdf", store=self.store
+                    )
+
+        asyncio.run(run())
+        self.assertEqual(attachments.requests, 1)
+
+    def test_link(self):
+        client = self.client(Attachments(**{"a.pdf": b"report"}))
+        save_path = os.path.join(self.directory.name, "out") + os.sep
+        client.download_attachment(
+            ADDRESS, 1, "a.pdf", save_path=save_path, store=self.store
+        )
+        digest, _ = self.store.lookup(ADDRESS, 1, "a.pdf")
+        self.assertTrue(
+            os.path.samefile(save_path + "a.pdf", self.store.blob_path(digest))
+        )
+
+    def test_link_falls_back_to_copy(self):
+        client = self.client(Attachments(**{"a.pdf": b"report"}))
+        save_path = os.path.join(self.directory.name, "out") + os.sep
+        # e.g. save_path on another filesystem
+        with mock.patch("os.link", side_effect=OSError("cross-device link")):
+            client.download_attachment(
+                ADDRESS, 1, "a.pdf", save_path=save_path, store=self.store
+            )
+
+        digest, _ = self.store.lookup(ADDRESS, 1, "a.pdf")
+        self.assertFalse(
+            os.path.samefile(save_path + "a.pdf", self.store.blob_path(digest))
+        )
+        with open(save_path + "a.pdf", "rb") as f:
+            self.assertEqual(f.read(), b"report")
+        self.assertFalse(os.path.exists(save_path + "a.pdf.tmp"))
+
+    def test_failed_stream_is_aborted(self):
+        client = self.client(
+            lambda request: httpx.Response(200, stream=FailingStream())
+        )
+        with self.assertRaises(httpx.ReadError):
+            client.download_attachment(ADDRESS, 1, "a.pdf", store=self.store)
+
+        self.assertEqual(os.listdir(self.store.tmp_dir), [])
+        self.assertEqual(self.blobs(), [])
+        self.assertIsNone(self.store.lookup(ADDRESS, 1, "a.pdf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+import unittest
+
+import httpx
+
+import secmail
+
+from server import inbox, serve
+
+
+MESSAGE = json.dumps(
+    {
+        "id": 1,
+        "from": "a@b.c",
+        "subject": "s",
+        "date": "d",
+        "attachments": [],
+        "body": "x" * 2000,
+        "textBody": "x" * 2000,
+        "htmlBody": "",
+    }
+).encode()
+
+
+def respond(params):
+    if params.get("action") == "readMessage":
+        return 200, MESSAGE
+    return 200, inbox(*range(100))
+
+
+class SlowBodyTest(unittest.TestCase):
+    """The server sends 40 bytes every 0.2 seconds, every single read is
+    faster than the timeout of the client but the body takes far longer
+    than the deadline."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.host = serve(respond, piece=40, pause=0.2)
+
+    def assertTakesAboutOneSecond(self, started):
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_timeout(self):
+        with secmail.Client(host=self.host, timeout=1.0) as client:
+            started = time.monotonic()
+            with self.assertRaises(secmail.DeadlineExceededError):
+                client.get_inbox("a@1secmail.com", timeout=1.0)
+            self.assertTakesAboutOneSecond(started)
+
+    def test_deadline(self):
+        with secmail.Client(host=self.host, timeout=1.0) as client:
+            started = time.monotonic()
+            with self.assertRaises(secmail.DeadlineExceededError):
+                with secmail.deadline(1.0):
+                    client.get_message("a@1secmail.com", 1)
+            self.assertTakesAboutOneSecond(started)
+
+    def test_async_deadline(self):
+        async def run():
+            async with secmail.AsyncClient(host=self.host, timeout=1.0) as client:
+                started = time.monotonic()
+                with self.assertRaises(secmail.DeadlineExceededError):
+                    with secmail.deadline(1.0):
+                        await client.get_message("a@1secmail.com", 1)
+                self.assertTakesAboutOneSecond(started)
+
+        asyncio.run(run())
+
+    def test_body_within_deadline(self):
+        host = serve(lambda params: (200, inbox(1, 2, 3)), piece=40, pause=0.05)
+        with secmail.Client(host=host) as client:
+            with secmail.deadline(5):
+                ids = [message.id for message in client.get_inbox("a@1secmail.com")]
+        self.assertEqual(ids, [1, 2, 3])
+
+    def test_body_read_by_transport(self):
+        # a mock transport hands back responses which were read already
+        client = secmail.Client()
+        client.client = httpx.Client(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, content=inbox(1))
+            )
+        )
+        with client, secmail.deadline(5):
+            ids = [message.id for message in client.get_inbox("a@1secmail.com")]
+        self.assertEqual(ids, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()